@@ -0,0 +1,176 @@
+# src/ann_index.py
+from __future__ import annotations
+import os
+import threading
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+import orjson
+
+try:
+    import faiss
+except ImportError:  # opțional: fără faiss, căutarea rămâne pe Chroma
+    faiss = None
+
+
+from .config import (
+    FAISS_DIR, FAISS_HNSW_M, FAISS_EF_CONSTRUCTION, FAISS_EF_SEARCH, FAISS_SHORTLIST, FAISS_SQ_TYPE,
+)
+
+INDEX_PATH = os.path.join(FAISS_DIR, "faiss.index")
+IDS_PATH = os.path.join(FAISS_DIR, "ids.npy")
+VECTORS_PATH = os.path.join(FAISS_DIR, "vectors.npy")
+META_PATH = os.path.join(FAISS_DIR, "meta.json")
+
+_lock = threading.Lock()
+# {"mtime": mtime_ns al INDEX_PATH, "index":..., "ids":[...], "vectors": ndarray, "by_id": {id: (doc, meta)}}
+_state: Optional[Dict[str, Any]] = None
+
+
+# FAISS_SQ_TYPE -> cuantizorul scalar din graf (octeți per dimensiune: 8bit=1, 4bit=0.5, fp16/bf16=2)
+_SQ_TYPES = {"8bit": "QT_8bit", "4bit": "QT_4bit", "fp16": "QT_fp16", "bf16": "QT_bf16"}
+
+
+def available() -> bool:
+    return faiss is not None
+
+
+def _sq_type() -> int:
+    qt = getattr(faiss.ScalarQuantizer, _SQ_TYPES.get(FAISS_SQ_TYPE, ""), None)
+    if qt is None:   # tip necunoscut sau lipsă din versiunea instalată de faiss (bf16 e mai nou)
+        raise ValueError(f"FAISS_SQ_TYPE nesuportat: {FAISS_SQ_TYPE!r} (opțiuni: {', '.join(_SQ_TYPES)})")
+    return qt
+
+
+def check_config() -> None:
+    """Ridică ValueError pentru un FAISS_SQ_TYPE nesuportat; ingestul o apelează înainte de orice scriere."""
+    if faiss is not None:
+        _sq_type()
+
+
+def clear() -> None:
+    """
+    Șterge indexul de pe disc (ex. colecția Chroma a fost golită): căutările revin pe Chroma până la
+    următorul build. INDEX_PATH dispare primul, deci un server pornit nu mai încarcă restul fișierelor.
+    """
+    global _state
+    for path in (INDEX_PATH, IDS_PATH, VECTORS_PATH, META_PATH):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    with _lock:
+        _state = None
+
+
+def _normalized(vectors: Any) -> np.ndarray:
+    X = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32))
+    if X.ndim == 1:
+        X = X.reshape(1, -1)
+    faiss.normalize_L2(X)
+    return X
+
+
+def build(ids: List[str], embeddings: Any, documents: List[str], metadatas: List[Dict[str, Any]]) -> bool:
+    """
+    Construiește indexul HNSW (produs scalar pe vectori normalizați = cosinus) și îl salvează pe disc.
+    Graful ține vectorii cuantizați scalar (implicit SQ8, 1 octet/dimensiune în loc de 4; vezi FAISS_SQ_TYPE);
+    pentru rescorarea listei scurte vectorii se păstrează separat, în float16 (jumătate din float32).
+    """
+    global _state
+    if faiss is None or not ids:
+        return False
+    X = _normalized(embeddings)
+    index = faiss.IndexHNSWSQ(X.shape[1], _sq_type(), FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = FAISS_EF_CONSTRUCTION
+    index.train(X)
+    index.add(X)
+
+    os.makedirs(FAISS_DIR, exist_ok=True)
+    # fiecare fișier: temporar + os.replace (un server care are vechiul vectors.npy mapat nu îl vede trunchiat);
+    # indexul se scrie ultimul, pentru că mtime-ul lui e semnalul de reîncărcare pentru serverele pornite
+    _replace(IDS_PATH, lambda fh: np.save(fh, np.asarray(ids)))
+    _replace(VECTORS_PATH, lambda fh: np.save(fh, X.astype(np.float16)))
+    meta = {i: [d, m] for i, d, m in zip(ids, documents, metadatas)}
+    _replace(META_PATH, lambda fh: fh.write(orjson.dumps(meta)))
+    _replace(INDEX_PATH, lambda fh: fh.write(faiss.serialize_index(index).tobytes()))
+
+    with _lock:
+        _state = None   # următorul search reîncarcă de pe disc
+    return True
+
+
+def _replace(path: str, write) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as fh:
+        write(fh)
+    os.replace(tmp, path)
+
+
+def _index_mtime() -> Optional[int]:
+    try:
+        return os.stat(INDEX_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _load() -> Optional[Dict[str, Any]]:
+    """
+    Indexul din memorie, reîncărcat când mtime-ul lui INDEX_PATH se schimbă (ex. `python -m src.ingest`
+    rulat cât serverul e pornit), ca în tools._state. None dacă nu există index (sau faiss lipsește).
+    """
+    global _state
+    if faiss is None:
+        return None
+    mtime = _index_mtime()
+    st = _state
+    if st is not None and st["mtime"] == mtime:
+        return st
+    with _lock:
+        if mtime is None:
+            _state = None   # index șters -> căutarea revine pe Chroma
+            return None
+        if _state is not None and _state["mtime"] == mtime:
+            return _state
+        index = faiss.read_index(INDEX_PATH)
+        index.hnsw.efSearch = FAISS_EF_SEARCH
+        ids = [str(x) for x in np.load(IDS_PATH)]
+        # mmap: se citesc de pe disc (page cache) doar rândurile din lista scurtă, nu toată matricea
+        vectors = np.load(VECTORS_PATH, mmap_mode="r")
+        with open(META_PATH, "rb") as f:
+            raw = f.read()
+        meta = orjson.loads(raw)
+        by_id = {k: (v[0], v[1]) for k, v in meta.items()}
+        _state = {"mtime": mtime, "index": index, "ids": ids, "vectors": vectors, "by_id": by_id}
+        return _state
+
+
+def warm() -> bool:
+    """Încarcă indexul de pe disc dinainte (la pornirea serverului). True dacă există un index FAISS."""
+    return _load() is not None
+
+
+def search(query_vec: List[float], n_results: int) -> Optional[Dict[str, Any]]:
+    """
+    Top-n pe indexul FAISS, în același format ca `collection.query` din Chroma
+    (liste imbricate, distanță cosinus = 1 - similaritate). None dacă indexul lipsește.
+    Indexul cuantizat dă o listă scurtă (FAISS_SHORTLIST), rescorată cu vectorii float16 (produs în float32).
+    """
+    st = _load()
+    if st is None:
+        return None
+    q = _normalized(query_vec)
+    _, pos = st["index"].search(q, max(n_results, FAISS_SHORTLIST))
+    pos = pos[0][pos[0] >= 0]
+    sims = st["vectors"][pos].astype(np.float32) @ q[0]
+    order = np.argsort(-sims)[:n_results]
+
+    ids, docs, metas, dists = [], [], [], []
+    for p, sim in zip(pos[order], sims[order]):
+        doc_id = st["ids"][p]
+        doc, meta = st["by_id"][doc_id]
+        ids.append(doc_id)
+        docs.append(doc)
+        metas.append(meta)
+        dists.append(1.0 - float(sim))
+    return {"ids": [ids], "documents": [docs], "metadatas": [metas], "distances": [dists]}
@@ -0,0 +1,77 @@
+# src/batcher.py
+from __future__ import annotations
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class EmbedBatcher:
+    """
+    Micro-batching pentru embeddings: cererile venite (din thread-uri diferite) în aceeași
+    fereastră de ~max_wait_ms pleacă într-un singur request `embeddings.create(input=[...])`.
+    Fiecare apelant primește un Future și așteaptă doar vectorul lui.
+    """
+
+    def __init__(self, embed_fn: Callable[[List[str]], List[List[float]]], max_batch: int = 64, max_wait_ms: float = 20.0,
+                 result_timeout: float = 120.0):
+        self.embed_fn = embed_fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.result_timeout = result_timeout   # apelantul nu așteaptă la nesfârșit un thread blocat
+        self._q: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def _ensure_started(self):
+        t = self._thread
+        if t is not None and t.is_alive():
+            return
+        with self._lock:
+            # pornit prima dată, sau repornit dacă thread-ul a murit între timp
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+                self._thread.start()
+
+    def embed(self, text: str) -> List[float]:
+        self._ensure_started()
+        fut: Future = Future()
+        self._q.put((text, fut))
+        return fut.result(timeout=self.result_timeout)
+
+    def _collect(self) -> List[Tuple[str, Future]]:
+        batch = [self._q.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._q.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._process(batch)
+            except Exception as e:
+                # orice eroare ajunge la apelanții lotului; thread-ul rămâne în viață pentru următoarele
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+
+    def _process(self, batch: List[Tuple[str, Future]]):
+        # același text cerut de mai mulți apelanți -> un singur input
+        unique: Dict[str, int] = {}
+        for text, _ in batch:
+            unique.setdefault(text, len(unique))
+        vecs = self.embed_fn(list(unique))
+        if len(vecs) != len(unique):
+            raise ValueError(f"embed_fn a întors {len(vecs)} vectori pentru {len(unique)} texte")
+        for text, fut in batch:
+            if not fut.done():
+                fut.set_result(vecs[unique[text]])
@@ -1,17 +1,70 @@
 # src/chat.py
 from __future__ import annotations
-from typing import List, Dict, Any, Optional, Tuple
+import json
+from typing import List, Dict, Any, Optional, Tuple, Iterator
 
-from openai import OpenAI
+from .config import (
+    CHAT_MODEL, SNIPPET_CACHE_ENABLED, SNIPPET_CACHE_THRESHOLD,
+    SNIPPET_CACHE_TTL_SEC, SNIPPET_CACHE_MAX_ENTRIES,
+)
+from .openai_client import client
+from .vector_store import search_with_rerank, embed_query
+from .tools import get_summary_by_title
+from . import response_cache, semantic_cache
 
-from .config import OPENAI_API_KEY, CHAT_MODEL
-from .vector_store import search_with_rerank
+# ---- Prompt static (prefix identic între apeluri -> prompt caching OpenAI) ----
+SYSTEM_PROMPT = (
+    "Ești Smart Librarian, un asistent pentru recomandări de cărți. "
+    "Ai acces la fragmente indexate (RAG). "
+    "Răspunde în română, clar și prietenos. "
+    "Dacă utilizatorul cere o carte anume, oferă un scurt rezumat. "
+    "Nu inventa titluri — rămâi la sursele disponibile."
+)
+INSTRUCTIONS = (
+    "Instrucțiuni:\n"
+    "- Recomandă 1-2 titluri, justifică pe scurt în funcție de teme/autor.\n"
+    "- Dacă utilizatorul a cerut un titlu concret, include pe scurt esența poveștii.\n"
+    "- Fii concis (max ~8–10 linii)."
+)
+SYSTEM_MSG = {"role": "system", "content": SYSTEM_PROMPT}
+INSTRUCTIONS_MSG = {"role": "user", "content": INSTRUCTIONS}
+PREFIX_MESSAGES = (SYSTEM_MSG, INSTRUCTIONS_MSG)   # aceleași obiecte la fiecare request; nu le modifica
 
-client = OpenAI(api_key=OPENAI_API_KEY or None)
+# Tool opțional (use_tool=True): modelul poate cere rezumatul altui titlu decât cel injectat deja
+TOOLS = (
+    {
+        "type": "function",
+        "function": {
+            "name": "get_summary_by_title",
+            "description": "Întoarce rezumatul complet al unei cărți din dataset, după titlul exact.",
+            "parameters": {
+                "type": "object",
+                "properties": {"title": {"type": "string", "description": "Titlul exact al cărții"}},
+                "required": ["title"],
+            },
+        },
+    },
+)
 
 # ---- Retrieval helper (cu reranking) ----
+# Întrebările reformulate aproape identic (cosinus >= SNIPPET_CACHE_THRESHOLD) refolosesc fragmentele găsite deja
+_snippet_cache = semantic_cache.SemanticCache(SNIPPET_CACHE_THRESHOLD, SNIPPET_CACHE_TTL_SEC, SNIPPET_CACHE_MAX_ENTRIES)
+
 def build_context_snippets(question: str, k: int = 3, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
-    return search_with_rerank(question, k=k, filters=filters)
+    if not SNIPPET_CACHE_ENABLED:
+        return search_with_rerank(question, k=k, filters=filters)
+    q_vec = embed_query(question)   # un singur embedding: cheie de cache + căutarea propriu-zisă
+    vec = semantic_cache.normalize(q_vec)
+    scope = semantic_cache.scope_key(k, filters or {})
+    cached = _snippet_cache.get(vec, scope)
+    if cached is not None:
+        return list(cached)
+    snippets = search_with_rerank(question, k=k, filters=filters, q_vec=q_vec)
+    _snippet_cache.put(vec, snippets, scope)
+    return list(snippets)
+
+def snippet_cache_stats() -> Dict[str, int]:
+    return _snippet_cache.stats()
 
 def _format_context(snippets: List[Dict[str, Any]]) -> str:
     lines = []
@@ -23,43 +76,166 @@ def _format_context(snippets: List[Dict[str, Any]]) -> str:
         lines.append(f"- {title} ({author}) [score={score}]")
     return "\n".join(lines)
 
-def chat_once(user_question: str, k: int = 3, filters: Optional[Dict[str, Any]] = None, return_usage: bool = False) -> str | Tuple[str, Dict[str, int]]:
-    """
-    Dacă return_usage=True => întoarce (answer, {"prompt_tokens":..,"completion_tokens":..,"total_tokens":..})
-    """
-    snippets = build_context_snippets(user_question, k=k, filters=filters)
+def _top_summary_message(snippets: List[Dict[str, Any]]) -> Optional[Dict[str, str]]:
+    """Rezumatul complet al primului titlu, pus direct în prompt (fără un al doilea apel LLM pentru tool)."""
+    if not snippets:
+        return None
+    title = (snippets[0].get("metadata", {}).get("title") or "").strip()
+    if not title:
+        return None
+    try:
+        summary = get_summary_by_title(title)
+    except FileNotFoundError:
+        return None
+    if not summary:
+        return None
+    return {"role": "system", "content": f"Rezumat complet pentru '{title}':\n{summary}"}
+
+def _run_tool(name: str, arguments: str) -> str:
+    if name != "get_summary_by_title":
+        return f"Tool necunoscut: {name}"
+    try:
+        title = (json.loads(arguments or "{}").get("title") or "").strip()
+        summary = get_summary_by_title(title) if title else None
+    except (ValueError, FileNotFoundError):
+        summary = None
+    return summary or "Nu am găsit un rezumat pentru acest titlu."
+
+def _add_usage(a: Dict[str, int], b: Dict[str, int]) -> Dict[str, int]:
+    return {key: a.get(key, 0) + b.get(key, 0) for key in a}
+
+def _usage_dict(usage: Any) -> Dict[str, int]:
+    details = getattr(usage, "prompt_tokens_details", None) if usage else None
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) if usage else 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) if usage else 0,
+        "total_tokens": getattr(usage, "total_tokens", 0) if usage else 0,
+        "cached_tokens": (getattr(details, "cached_tokens", 0) or 0) if details else 0,
+    }
+
+def _prompt(user_question: str, history: str) -> str:
+    """Întrebarea, precedată de prefixul de istoric al sesiunii (dacă există)."""
+    return f"{history}Întrebarea curentă: {user_question}" if history else user_question
+
+def _build_messages(user_question: str, k: int, filters: Optional[Dict[str, Any]],
+                    snippets: Optional[List[Dict[str, Any]]] = None, history: str = "") -> List[Dict[str, str]]:
+    if snippets is None:
+        snippets = build_context_snippets(user_question, k=k, filters=filters)
     context_bullets = _format_context(snippets)
 
-    system = (
-        "Ești Smart Librarian, un asistent pentru recomandări de cărți. "
-        "Ai acces la fragmente indexate (RAG). "
-        "Răspunde în română, clar și prietenos. "
-        "Dacă utilizatorul cere o carte anume, oferă un scurt rezumat. "
-        "Nu inventa titluri — rămâi la sursele disponibile."
-    )
     content = (
-        f"Întrebare: {user_question}\n\n"
-        f"Fragmente relevante (top-{k}):\n{context_bullets}\n\n"
-        f"Instrucțiuni:\n"
-        f"- Recomandă 1-2 titluri, justifică pe scurt în funcție de teme/autor.\n"
-        f"- Dacă utilizatorul a cerut un titlu concret, include pe scurt esența poveștii.\n"
-        f"- Fii concis (max ~8–10 linii)."
+        f"Întrebare: {_prompt(user_question, history)}\n\n"
+        f"Fragmente relevante:\n{context_bullets}"
     )
 
+    messages = list(PREFIX_MESSAGES)
+    summary_msg = _top_summary_message(snippets)
+    if summary_msg:
+        messages.append(summary_msg)
+    messages.append({"role": "user", "content": content})
+    return messages
+
+def chat_once(user_question: str, k: int = 3, filters: Optional[Dict[str, Any]] = None, return_usage: bool = False,
+              snippets: Optional[List[Dict[str, Any]]] = None, use_tool: bool = False,
+              history: str = "") -> str | Tuple[str, Dict[str, int]]:
+    """
+    Dacă return_usage=True => întoarce (answer, {"prompt_tokens":..,"completion_tokens":..,"total_tokens":..,"cached_tokens":..})
+    Dacă apelantul are deja fragmentele (ex. pentru lista de surse), le trimite în `snippets` și retrieval-ul nu se mai repetă.
+    Partea statică (system + instrucțiuni) stă la început, iar întrebarea și fragmentele la final,
+    ca prefixul să fie identic byte cu byte între apeluri (prompt caching).
+    `history` e prefixul de istoric al sesiunii (vezi server.history_prefix), pus în prompt înaintea întrebării.
+    Același prompt (istoric + întrebare) primește răspunsul din cache fără apel LLM; potrivirea semantică
+    (cosinus >= RESPONSE_CACHE_THRESHOLD) se face doar pe întrebări fără istoric. Retrieval-ul se evită
+    doar dacă apelantul n-a trimis deja `snippets` (serverul le calculează oricum, pentru surse).
+    Cu use_tool=True modelul primește și tool-ul get_summary_by_title; al doilea apel se face doar
+    dacă modelul chiar îl cere (rezumatul primului titlu e deja în prompt).
+    """
+    scope = response_cache.scope_key(CHAT_MODEL, k, filters)
+    prompt = _prompt(user_question, history)
+    semantic_q = None if history else user_question
+    cached = response_cache.get(prompt, scope, semantic_q)
+    if cached is not None:
+        return (cached, _usage_dict(None)) if return_usage else cached
+
+    messages = _build_messages(user_question, k, filters, snippets, history)
+    extra: Dict[str, Any] = {"tools": list(TOOLS)} if use_tool else {}
     resp = client.chat.completions.create(
         model=CHAT_MODEL,
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": content}
-        ],
+        messages=messages,
         temperature=0.6,
         max_tokens=450,
+        **extra,
     )
-    answer = resp.choices[0].message.content.strip()
-    usage = getattr(resp, "usage", None)
-    usage_dict = {
-        "prompt_tokens": getattr(usage, "prompt_tokens", 0) if usage else 0,
-        "completion_tokens": getattr(usage, "completion_tokens", 0) if usage else 0,
-        "total_tokens": getattr(usage, "total_tokens", 0) if usage else 0,
-    }
+    usage_dict = _usage_dict(getattr(resp, "usage", None))
+    msg = resp.choices[0].message
+
+    tool_calls = getattr(msg, "tool_calls", None) if use_tool else None
+    if tool_calls:
+        messages.append({
+            "role": "assistant",
+            "content": msg.content or "",
+            "tool_calls": [
+                {"id": tc.id, "type": "function",
+                 "function": {"name": tc.function.name, "arguments": tc.function.arguments}}
+                for tc in tool_calls
+            ],
+        })
+        for tc in tool_calls:
+            messages.append({"role": "tool", "tool_call_id": tc.id,
+                             "content": _run_tool(tc.function.name, tc.function.arguments)})
+        resp = client.chat.completions.create(
+            model=CHAT_MODEL,
+            messages=messages,
+            temperature=0.6,
+            max_tokens=450,
+        )
+        usage_dict = _add_usage(usage_dict, _usage_dict(getattr(resp, "usage", None)))
+        msg = resp.choices[0].message
+
+    answer = (msg.content or "").strip()
+    response_cache.put(prompt, answer, scope, semantic_q)
     return (answer, usage_dict) if return_usage else answer
+
+def chat_once_stream(user_question: str, k: int = 3, filters: Optional[Dict[str, Any]] = None, usage: Optional[Dict[str, int]] = None,
+                     snippets: Optional[List[Dict[str, Any]]] = None, history: str = "") -> Iterator[str]:
+    """
+    Ca chat_once, dar cu stream=True: produce fragmentele de text pe măsură ce vin de la model.
+    Dacă primește un dict `usage`, îl completează la final cu tokenii consumați.
+    """
+    scope = response_cache.scope_key(CHAT_MODEL, k, filters)
+    prompt = _prompt(user_question, history)
+    semantic_q = None if history else user_question
+    cached = response_cache.get(prompt, scope, semantic_q)
+    if cached is not None:
+        if usage is not None:
+            usage.update(_usage_dict(None))
+        yield cached
+        return
+
+    stream = client.chat.completions.create(
+        model=CHAT_MODEL,
+        messages=_build_messages(user_question, k, filters, snippets, history),
+        temperature=0.6,
+        max_tokens=450,
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    parts: List[str] = []
+    last_usage = None
+    try:
+        for chunk in stream:
+            if getattr(chunk, "usage", None):
+                last_usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+    finally:
+        # clientul s-a deconectat sau a apărut o eroare: eliberăm imediat conexiunea către OpenAI
+        stream.close()
+
+    if usage is not None:
+        usage.update(_usage_dict(last_usage))
+    response_cache.put(prompt, "".join(parts).strip(), scope, semantic_q)
@@ -1,24 +1,175 @@
 import os
+from dataclasses import dataclass
+from typing import Tuple
+
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Chei & directoare
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
-CHROMA_DIR = os.getenv("CHROMA_DIR", "data/chroma_db")
-
-# Modele
-CHAT_MODEL = "gpt-4o-mini"
-EMBEDDING_MODEL = "text-embedding-3-small"
-IMAGE_MODEL = "gpt-image-1"          # pentru /api/image
-TTS_MODEL = "gpt-4o-mini-tts"        # pentru /api/tts (opțional)
-STT_MODEL = "whisper-1"              # pentru /api/stt (opțional)
-
-ALLOWED_ORIGINS = [o.strip() for o in os.getenv("ALLOWED_ORIGINS", "http://localhost:8000").split(",") if o.strip()]
-MAX_PROMPT_CHARS = int(os.getenv("MAX_PROMPT_CHARS", "2000"))
-MAX_TTS_CHARS = int(os.getenv("MAX_TTS_CHARS", "2000"))
-MAX_STT_MB = int(os.getenv("MAX_STT_MB", "12"))  # limită upload audio STT (MB)
-
-# CSRF (opțional). Dacă REQUIRE_CSRF=1, toate POST-urile cer headerul x-csrf-token=CSRF_TOKEN
-REQUIRE_CSRF = os.getenv("REQUIRE_CSRF", "0") == "1"
-CSRF_TOKEN = os.getenv("CSRF_TOKEN", "")
\ No newline at end of file
+
+@dataclass(frozen=True, slots=True)
+class Config:
+    """Configurația procesului, citită o singură dată din mediu (.env) la import."""
+    # Chei & directoare
+    openai_api_key: str
+    chroma_dir: str
+
+    # Modele
+    chat_model: str
+    embedding_model: str
+    image_model: str
+    tts_model: str
+    stt_model: str
+    embedding_backend: str
+
+    allowed_origins: Tuple[str, ...]
+    max_prompt_chars: int
+    max_tts_chars: int
+    max_stt_mb: int
+
+    # Cache pe disc pentru audio TTS
+    tts_cache_dir: str
+    tts_cache_max_mb: int
+
+    # CSRF (opțional)
+    require_csrf: bool
+    csrf_token: str
+
+    # Micro-batching pentru embedding-urile întrebărilor
+    embed_batch_max: int
+    embed_batch_wait_ms: float
+
+    # Cache semantic de răspunsuri (în fața chat_once)
+    response_cache_enabled: bool
+    response_cache_threshold: float
+    response_cache_ttl_sec: int
+    response_cache_max_entries: int
+    response_cache_exact_ttl_sec: int
+    response_cache_exact_max_entries: int
+
+    # Cache semantic de fragmente (în fața build_context_snippets)
+    snippet_cache_enabled: bool
+    snippet_cache_threshold: float
+    snippet_cache_ttl_sec: int
+    snippet_cache_max_entries: int
+
+    # Parametri HNSW pentru colecția Chroma (aplicați la crearea colecției)
+    chroma_hnsw_m: int
+    chroma_hnsw_construction_ef: int
+    chroma_hnsw_search_ef: int
+
+    # Index FAISS opțional
+    faiss_dir: str
+    faiss_hnsw_m: int
+    faiss_ef_construction: int
+    faiss_ef_search: int
+    faiss_shortlist: int
+    faiss_sq_type: str
+
+
+def _from_env() -> Config:
+    return Config(
+        openai_api_key=os.getenv("OPENAI_API_KEY", ""),
+        chroma_dir=os.getenv("CHROMA_DIR", "data/chroma_db"),
+
+        chat_model="gpt-4o-mini",
+        embedding_model="text-embedding-3-small",
+        image_model="gpt-image-1",          # pentru /api/image
+        tts_model="gpt-4o-mini-tts",        # pentru /api/tts (opțional)
+        stt_model="whisper-1",              # pentru /api/stt (opțional)
+        # "local" = all-MiniLM-L6-v2 (ONNX, inclus în chromadb) pe CPU, fără apel de rețea per întrebare;
+        # schimbarea cere un ingest complet (alt model, altă dimensiune a vectorilor)
+        embedding_backend=os.getenv("EMBEDDING_BACKEND", "openai").strip().lower(),
+
+        allowed_origins=tuple(o.strip() for o in os.getenv("ALLOWED_ORIGINS", "http://localhost:8000").split(",") if o.strip()),
+        max_prompt_chars=int(os.getenv("MAX_PROMPT_CHARS", "2000")),
+        max_tts_chars=int(os.getenv("MAX_TTS_CHARS", "2000")),
+        max_stt_mb=int(os.getenv("MAX_STT_MB", "12")),  # limită upload audio STT (MB)
+
+        tts_cache_dir=os.getenv("TTS_CACHE_DIR", "data/tts_cache"),
+        tts_cache_max_mb=int(os.getenv("TTS_CACHE_MAX_MB", "500")),  # peste limită se șterg fișierele folosite cel mai demult
+
+        # Dacă REQUIRE_CSRF=1, toate POST-urile cer headerul x-csrf-token=CSRF_TOKEN
+        require_csrf=os.getenv("REQUIRE_CSRF", "0") == "1",
+        csrf_token=os.getenv("CSRF_TOKEN", ""),
+
+        embed_batch_max=int(os.getenv("EMBED_BATCH_MAX", "64")),
+        embed_batch_wait_ms=float(os.getenv("EMBED_BATCH_WAIT_MS", "10")),  # cât așteaptă o cerere după vecinele ei
+
+        response_cache_enabled=os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1",
+        response_cache_threshold=float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.92")),  # similaritate cosinus minimă
+        response_cache_ttl_sec=int(os.getenv("RESPONSE_CACHE_TTL_SEC", "3600")),
+        response_cache_max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000")),
+        # nivelul exact (sha256 pe prompt) răspunde înainte de embedding
+        response_cache_exact_ttl_sec=int(os.getenv("RESPONSE_CACHE_EXACT_TTL_SEC", "600")),
+        response_cache_exact_max_entries=int(os.getenv("RESPONSE_CACHE_EXACT_MAX_ENTRIES", "2048")),
+
+        snippet_cache_enabled=os.getenv("SNIPPET_CACHE_ENABLED", "1") == "1",
+        snippet_cache_threshold=float(os.getenv("SNIPPET_CACHE_THRESHOLD", "0.90")),  # distanță cosinus <= 0.1
+        snippet_cache_ttl_sec=int(os.getenv("SNIPPET_CACHE_TTL_SEC", "3600")),       # re-ingestul se vede după TTL
+        snippet_cache_max_entries=int(os.getenv("SNIPPET_CACHE_MAX_ENTRIES", "512")),
+
+        # se aplică doar colecțiilor noi: după schimbare, rulează din nou ingestul complet
+        chroma_hnsw_m=int(os.getenv("CHROMA_HNSW_M", "24")),
+        chroma_hnsw_construction_ef=int(os.getenv("CHROMA_HNSW_CONSTRUCTION_EF", "128")),
+        chroma_hnsw_search_ef=int(os.getenv("CHROMA_HNSW_SEARCH_EF", "64")),
+
+        # construit la ingest lângă Chroma; necesită `pip install faiss-cpu`
+        faiss_dir=os.getenv("FAISS_DIR", "data/faiss"),
+        faiss_hnsw_m=int(os.getenv("FAISS_HNSW_M", "32")),
+        faiss_ef_construction=int(os.getenv("FAISS_EF_CONSTRUCTION", "200")),
+        faiss_ef_search=int(os.getenv("FAISS_EF_SEARCH", "64")),
+        faiss_shortlist=int(os.getenv("FAISS_SHORTLIST", "50")),  # candidați din indexul cuantizat, rescorați cu vectorii float16
+        faiss_sq_type=os.getenv("FAISS_SQ_TYPE", "8bit").strip().lower(),  # 8bit | 4bit | fp16 | bf16
+    )
+
+
+CFG = _from_env()
+
+# Nume la nivel de modul, păstrate pentru importurile existente (`from .config import CHAT_MODEL`)
+OPENAI_API_KEY = CFG.openai_api_key
+CHROMA_DIR = CFG.chroma_dir
+
+CHAT_MODEL = CFG.chat_model
+EMBEDDING_MODEL = CFG.embedding_model
+IMAGE_MODEL = CFG.image_model
+TTS_MODEL = CFG.tts_model
+STT_MODEL = CFG.stt_model
+EMBEDDING_BACKEND = CFG.embedding_backend
+
+ALLOWED_ORIGINS = list(CFG.allowed_origins)
+MAX_PROMPT_CHARS = CFG.max_prompt_chars
+MAX_TTS_CHARS = CFG.max_tts_chars
+MAX_STT_MB = CFG.max_stt_mb
+
+TTS_CACHE_DIR = CFG.tts_cache_dir
+TTS_CACHE_MAX_MB = CFG.tts_cache_max_mb
+
+REQUIRE_CSRF = CFG.require_csrf
+CSRF_TOKEN = CFG.csrf_token
+
+EMBED_BATCH_MAX = CFG.embed_batch_max
+EMBED_BATCH_WAIT_MS = CFG.embed_batch_wait_ms
+
+RESPONSE_CACHE_ENABLED = CFG.response_cache_enabled
+RESPONSE_CACHE_THRESHOLD = CFG.response_cache_threshold
+RESPONSE_CACHE_TTL_SEC = CFG.response_cache_ttl_sec
+RESPONSE_CACHE_MAX_ENTRIES = CFG.response_cache_max_entries
+RESPONSE_CACHE_EXACT_TTL_SEC = CFG.response_cache_exact_ttl_sec
+RESPONSE_CACHE_EXACT_MAX_ENTRIES = CFG.response_cache_exact_max_entries
+
+SNIPPET_CACHE_ENABLED = CFG.snippet_cache_enabled
+SNIPPET_CACHE_THRESHOLD = CFG.snippet_cache_threshold
+SNIPPET_CACHE_TTL_SEC = CFG.snippet_cache_ttl_sec
+SNIPPET_CACHE_MAX_ENTRIES = CFG.snippet_cache_max_entries
+
+CHROMA_HNSW_M = CFG.chroma_hnsw_m
+CHROMA_HNSW_CONSTRUCTION_EF = CFG.chroma_hnsw_construction_ef
+CHROMA_HNSW_SEARCH_EF = CFG.chroma_hnsw_search_ef
+
+FAISS_DIR = CFG.faiss_dir
+FAISS_HNSW_M = CFG.faiss_hnsw_m
+FAISS_EF_CONSTRUCTION = CFG.faiss_ef_construction
+FAISS_EF_SEARCH = CFG.faiss_ef_search
+FAISS_SHORTLIST = CFG.faiss_shortlist
+FAISS_SQ_TYPE = CFG.faiss_sq_type
@@ -1,40 +1,51 @@
 from __future__ import annotations
+import hashlib
 import json
 import os
 import re
-import uuid
+import sys
+import unicodedata
 from typing import List, Dict, Any
 
-from .vector_store import reset_collection, add_chunks
+import numpy as np
+
+from .vector_store import reset_collection, add_chunks, existing_ids, rebuild_ann_index
+from . import ann_index
 from .config import CHROMA_DIR
 
 SENT_SPLIT = re.compile(r'(?<=[\.\!\?\:])\s+')
+SLUG_RE = re.compile(r"[^a-z0-9]+")
 
 def chunk_text(text: str, target_chars: int = 750, overlap: int = 120) -> List[str]:
-    """Împarte textul în bucăți ~750c cu overlap ~120c, pe limite de propoziții."""
+    """
+    Împarte textul în bucăți ~750c cu overlap ~120c, pe limite de propoziții.
+    Lucrează pe offset-uri (sume prefix peste lungimile propozițiilor), fără concatenări repetate:
+    fiecare bucată e un singur " ".join, iar overlap-ul reia propozițiile întregi din ultimele ~overlap caractere.
+    """
     text = (text or "").strip()
     if not text:
         return []
-    sentences = SENT_SPLIT.split(text)
+    sents = [s.strip() for s in SENT_SPLIT.split(text)]
+    sents = [s for s in sents if s]
+    if not sents:
+        return []
+    n = len(sents)
+    # cs[j] = lungimea propozițiilor [0, j) unite cu câte un spațiu (+1 față de " ".join)
+    cs = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.fromiter((len(s) + 1 for s in sents), dtype=np.int64, count=n), out=cs[1:])
+
     chunks: List[str] = []
-    buf = ""
-    for s in sentences:
-        s = s.strip()
-        if not s:
-            continue
-        if len(buf) + len(s) + 1 <= target_chars:
-            buf = (buf + " " + s).strip()
-        else:
-            if buf:
-                chunks.append(buf)
-                # overlap simplu: ultimele ~overlap caractere intră în noul buffer
-                if overlap > 0 and len(buf) > overlap:
-                    buf = buf[-overlap:]
-                else:
-                    buf = ""
-            buf = (buf + " " + s).strip()
-    if buf:
-        chunks.append(buf)
+    i = 0
+    while i < n:
+        # cel mai mare j cu len(" ".join(sents[i:j])) <= target_chars; minim o propoziție
+        j = int(np.searchsorted(cs, cs[i] + target_chars + 1, side="right")) - 1
+        j = max(j, i + 1)
+        chunks.append(" ".join(sents[i:j]))
+        if j >= n:
+            break
+        # prima propoziție care începe în ultimele ~overlap caractere ale bucății
+        nxt = int(np.searchsorted(cs, cs[j] - overlap, side="left")) if overlap > 0 else j
+        i = nxt if i < nxt < j else j
     return chunks
 
 def load_dataset(path: str) -> List[Dict[str, Any]]:
@@ -81,59 +92,114 @@ def load_dataset(path: str) -> List[Dict[str, Any]]:
 
     raise AssertionError("book_summaries.json trebuie să fie o listă sau un obiect mapat pe titlu.")
 
-def main():
+def _slug(title: str) -> str:
+    """Slug lizibil pentru ID-uri (doar prefix: „Ion” și „ION” dau același slug)."""
+    norm = unicodedata.normalize("NFKD", title).encode("ascii", "ignore").decode("ascii")
+    return SLUG_RE.sub("-", norm.lower()).strip("-") or "untitled"
+
+def _book_key(title: str, author: str, summary: str) -> str:
+    """
+    Cheie stabilă și unică per carte: slug + hash scurt pe titlul și autorul originale,
+    deci „Ion” / „ION” / „Ion!” sau „Război și pace” / „Razboi si pace” nu se mai ciocnesc.
+    Fără titlu, intră în hash și rezumatul (altfel toate cărțile fără titlu ar avea aceeași cheie).
+    """
+    raw = f"{title}\n{author}" if title else f"\n{author}\n{summary}"
+    return f"{_slug(title)}-{hashlib.sha1(raw.encode('utf-8')).hexdigest()[:8]}"
+
+def _base_meta(item: Dict[str, Any]) -> Dict[str, Any]:
+    title = (item.get("title") or "").strip()
+    author = (item.get("author") or "").strip()
+
+    # themes poate fi listă/str/None; pentru Chroma o convertim la string
+    raw_themes = item.get("themes") or item.get("tags") or []
+    if isinstance(raw_themes, str):
+        themes_list = [raw_themes]
+    elif isinstance(raw_themes, list):
+        themes_list = [str(x) for x in raw_themes if x is not None]
+    else:
+        themes_list = []
+    themes_str = ", ".join([t.strip() for t in themes_list if t.strip()])
+
+    year = item.get("year") or item.get("published") or ""
+    lang = item.get("language") or "ro"
+    themes_low = [t.strip().lower() for t in themes_str.split(",") if t.strip()]
+    return {
+        "title": title,           # str
+        "author": author,         # str
+        "themes": themes_str,     # str (NU listă -> evita eroarea Chroma)
+        "year": year,             # int/str (scalar)
+        "language": lang,         # str
+        # precalculate pentru rerank (search_with_rerank), ca să nu se refacă la fiecare întrebare
+        "title_low": title.lower(),                                   # str
+        "author_low": author.lower(),                                 # str
+        "themes_low": json.dumps(themes_low, ensure_ascii=False),     # str (listă JSON)
+    }
+
+def main(incremental: bool = False):
+    """
+    Indexează datasetul în Chroma. ID-urile sunt deterministe (`<slug-titlu>-<hash>:<i>`), așa că
+    `--incremental` păstrează colecția și adaugă doar fragmentele cu ID-uri noi.
+    Dacă rezumatul unei cărți existente se schimbă, rulează fără `--incremental`.
+    Două intrări cu același titlu și autor sunt raportate înainte de orice scriere.
+    """
     os.makedirs(CHROMA_DIR, exist_ok=True)
-    reset_collection()
+    ann_index.check_config()   # un FAISS_SQ_TYPE greșit oprește ingestul înainte să atingă Chroma
 
     data_path = os.path.join("data", "book_summaries.json")
     dataset = load_dataset(data_path)
 
-    all_chunks: List[str] = []
-    all_metas: List[Dict[str, Any]] = []
-    all_ids: List[str] = []
-
+    # pasul 1: fragmentele fiecărei cărți (rezumat complet, cu fallback pe câmpuri alternative)
+    per_book = []
+    seen: set = set()
+    duplicates: List[str] = []
     for item in dataset:
-        title = (item.get("title") or "").strip()
-        author = (item.get("author") or "").strip()
-
-        # themes poate fi listă/str/None; pentru Chroma o convertim la string
-        raw_themes = item.get("themes") or item.get("tags") or []
-        if isinstance(raw_themes, str):
-            themes_list = [raw_themes]
-        elif isinstance(raw_themes, list):
-            themes_list = [str(x) for x in raw_themes if x is not None]
-        else:
-            themes_list = []
-        themes_str = ", ".join([t.strip() for t in themes_list if t.strip()])
-
-        year = item.get("year") or item.get("published") or ""
-        lang = item.get("language") or "ro"
-
-        # rezumat complet (fallback pe câmpuri alternative)
         summary = item.get("summary_full") or item.get("summary") or item.get("text") or item.get("short_summary") or ""
-        chunks = chunk_text(summary, target_chars=750, overlap=120)
-
+        base_meta = _base_meta(item)
+        key = _book_key(base_meta["title"], base_meta["author"], summary)
+        if key in seen:
+            duplicates.append(base_meta["title"] or "(fără titlu)")
+            continue
+        seen.add(key)
+        per_book.append((key, base_meta, chunk_text(summary, target_chars=750, overlap=120)))
+    if duplicates:
+        raise ValueError("Cărți duplicate în book_summaries.json (același titlu și autor): "
+                         + ", ".join(sorted(set(duplicates))))
+    total = sum(len(chunks) for _, _, chunks in per_book)
+    if not incremental:
+        reset_collection()   # abia după validare: un dataset greșit nu mai golește colecția existentă
+
+    # pasul 2: liste paralele prealocate, umplute pe index
+    all_chunks: List[str] = [""] * total
+    all_metas: List[Dict[str, Any]] = [{}] * total
+    all_ids: List[str] = [""] * total
+    pos = 0
+    for key, base_meta, chunks in per_book:
+        n = len(chunks)
         for i, ch in enumerate(chunks):
-            meta = {
-                "title": title,           # str
-                "author": author,         # str
-                "themes": themes_str,     # str (NU listă -> evita eroarea Chroma)
-                "year": year,             # int/str (scalar)
-                "language": lang,         # str
-                "chunk": i,               # int
-                "chunks_total": len(chunks)  # int
-            }
-            all_chunks.append(ch)
-            all_metas.append(meta)
-            all_ids.append(str(uuid.uuid4()))
+            all_chunks[pos] = ch
+            all_metas[pos] = {**base_meta, "chunk": i, "chunks_total": n}  # int, int
+            all_ids[pos] = f"{key}:{i}"
+            pos += 1
 
     if not all_chunks:
         print("⚠️ Nu există conținut de indexat (book_summaries.json gol?).")
         return
 
+    if incremental:
+        known = existing_ids(all_ids)
+        keep = [j for j, doc_id in enumerate(all_ids) if doc_id not in known]
+        all_chunks = [all_chunks[j] for j in keep]
+        all_metas = [all_metas[j] for j in keep]
+        all_ids = [all_ids[j] for j in keep]
+        if not all_chunks:
+            print("✅ Nimic nou de indexat.")
+            return
+
     print(f"Indexez {len(all_chunks)} fragmente…")
     add_chunks(all_chunks, all_metas, all_ids)
     print("✅ Gata — Chroma DB actualizat.")
+    if rebuild_ann_index():
+        print("✅ Index FAISS reconstruit.")
 
 if __name__ == "__main__":
-    main()
+    main(incremental="--incremental" in sys.argv[1:])
@@ -0,0 +1,36 @@
+# src/openai_client.py
+"""
+Clienții OpenAI ai procesului: `client` (sync, pentru codul care rulează în thread-uri: chat,
+embeddings, ingest) și `async_client` (pentru endpoint-urile async: TTS, STT, imagini).
+"""
+import httpx
+from openai import OpenAI, AsyncOpenAI
+
+from .config import OPENAI_API_KEY
+
+_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+# implicit (chat, embeddings): răspunsuri de ordinul secundelor -> 30 s ajung
+_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+# imagini / TTS / STT: gpt-image-1 trece des de 30 s; păstrăm limita implicită a SDK-ului (600 s).
+# Se dă per apel (with_options / timeout=), nu pe tot clientul.
+MEDIA_TIMEOUT = httpx.Timeout(600.0, connect=5.0)
+
+def _http_client() -> httpx.Client:
+    try:
+        return httpx.Client(http2=True, limits=_LIMITS, timeout=_TIMEOUT)
+    except ImportError:
+        # http2 cere pachetul `h2` (httpx[http2]); fără el rămânem pe HTTP/1.1 cu keep-alive
+        return httpx.Client(limits=_LIMITS, timeout=_TIMEOUT)
+
+def _async_http_client() -> httpx.AsyncClient:
+    try:
+        return httpx.AsyncClient(http2=True, limits=_LIMITS, timeout=_TIMEOUT)
+    except ImportError:
+        return httpx.AsyncClient(limits=_LIMITS, timeout=_TIMEOUT)
+
+# un singur pool de conexiuni -> conexiunile TLS se refolosesc între embeddings și chat
+client = OpenAI(api_key=OPENAI_API_KEY or None, http_client=_http_client())
+# apelurile await-ate nu ocupă câte un thread din threadpool cât așteaptă după rețea
+async_client = AsyncOpenAI(api_key=OPENAI_API_KEY or None, http_client=_async_http_client())
+# același pool, dar cu MEDIA_TIMEOUT: folosit de /api/tts, /api/stt și /api/image
+media_client = async_client.with_options(timeout=MEDIA_TIMEOUT)
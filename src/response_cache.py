@@ -0,0 +1,101 @@
+# src/response_cache.py
+from __future__ import annotations
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from .config import (
+    RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_THRESHOLD,
+    RESPONSE_CACHE_TTL_SEC, RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_EXACT_TTL_SEC, RESPONSE_CACHE_EXACT_MAX_ENTRIES,
+)
+from .vector_store import embed_query
+from . import semantic_cache
+
+
+def scope_key(model: str, k: int, filters: Optional[Dict[str, Any]] = None) -> str:
+    """Răspunsurile se refolosesc doar pentru același model / top-k / filtre."""
+    return semantic_cache.scope_key(model, k, filters or {})
+
+
+# Nivelul 1: potrivire exactă pe (scope, prompt) — prompt-ul include deja prefixul de istoric al sesiunii.
+# Un hit aici nu mai cere nici embedding, nici apel LLM.
+_exact: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+_exact_lock = threading.Lock()
+_exact_hits = 0
+
+
+def _exact_key(question: str, scope: str) -> str:
+    return hashlib.sha256(f"{scope}|{question}".encode("utf-8")).hexdigest()
+
+
+def _exact_get(key: str) -> Optional[str]:
+    global _exact_hits
+    with _exact_lock:
+        hit = _exact.get(key)
+        if hit is None:
+            return None
+        if time.time() - hit[0] > RESPONSE_CACHE_EXACT_TTL_SEC:
+            del _exact[key]
+            return None
+        _exact.move_to_end(key)
+        _exact_hits += 1
+        return hit[1]
+
+
+def _exact_put(key: str, answer: str) -> None:
+    with _exact_lock:
+        _exact[key] = (time.time(), answer)
+        _exact.move_to_end(key)
+        while len(_exact) > RESPONSE_CACHE_EXACT_MAX_ENTRIES:
+            _exact.popitem(last=False)
+
+
+# Nivelul 2: similaritate semantică între întrebări
+_cache = semantic_cache.SemanticCache(RESPONSE_CACHE_THRESHOLD, RESPONSE_CACHE_TTL_SEC, RESPONSE_CACHE_MAX_ENTRIES)
+
+
+def _vector(question: str) -> np.ndarray:
+    return semantic_cache.normalize(embed_query(question))
+
+
+def get(prompt: str, scope: str = "", question: Optional[str] = None) -> Optional[str]:
+    """
+    Nivelul exact compară tot prompt-ul (cu tot cu istoricul sesiunii). Nivelul semantic compară doar
+    `question` — întrebarea goală, trimisă de apelant numai când nu există istoric; cu None e sărit.
+    Altfel două ture consecutive din aceeași sesiune (istoric aproape identic) s-ar potrivi între ele.
+    """
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    answer = _exact_get(_exact_key(prompt, scope))
+    if answer is not None or question is None:
+        return answer
+    try:
+        return _cache.get(_vector(question), scope)
+    except Exception:
+        # cache-ul nu trebuie să blocheze chat-ul (ex. eroare la embeddings)
+        return None
+
+
+def put(prompt: str, answer: str, scope: str = "", question: Optional[str] = None) -> None:
+    if not RESPONSE_CACHE_ENABLED or not answer:
+        return
+    _exact_put(_exact_key(prompt, scope), answer)
+    if question is None:
+        return
+    try:
+        _cache.put(_vector(question), answer, scope)
+    except Exception:
+        pass
+
+
+def stats() -> Dict[str, int]:
+    out = _cache.stats()
+    with _exact_lock:
+        out["exact_hits"] = _exact_hits
+        out["exact_size"] = len(_exact)
+    return out
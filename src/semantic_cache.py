@@ -0,0 +1,87 @@
+# src/semantic_cache.py
+from __future__ import annotations
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+def scope_key(*parts: Any) -> str:
+    """Intrările se refolosesc doar în același scope (ex. model / top-k / filtre)."""
+    raw = json.dumps(list(parts), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def normalize(vec: Any) -> np.ndarray:
+    """Vector float32 de normă 1 (produsul scalar devine similaritate cosinus)."""
+    v = np.array(vec, dtype=np.float32)
+    norm = float(np.linalg.norm(v))
+    if norm > 0:
+        v /= norm
+    return v
+
+
+class SemanticCache:
+    """
+    Cache aproximativ embedding -> valoare, pe similaritate cosinus.
+    Cheile stau într-o singură matrice float32 prealocată, iar lookup-ul e un singur produs
+    E @ q + argmax — fără index ANN, suficient pentru câteva mii de intrări.
+    La capacitate maximă se înlocuiește intrarea folosită cel mai demult (LRU).
+    Vectorii primiți trebuie să fie deja normalizați (vezi `normalize`).
+    """
+
+    def __init__(self, threshold: float, ttl_sec: int, max_entries: int):
+        self.threshold = threshold
+        self.ttl_sec = ttl_sec
+        self.max_entries = max(1, max_entries)
+        self.lock = threading.Lock()
+        self._E: Optional[np.ndarray] = None          # (max_entries, d), alocată la primul put
+        self._ts = np.zeros(self.max_entries, dtype=np.float64)     # momentul inserării (TTL)
+        self._used = np.zeros(self.max_entries, dtype=np.float64)   # ultima folosire (LRU)
+        self._scopes = np.full(self.max_entries, "", dtype=object)
+        self._values: List[Any] = [None] * self.max_entries
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, vec: np.ndarray, scope: str = "") -> Optional[Any]:
+        now = time.time()
+        with self.lock:
+            if self._E is None or self._size == 0 or self._E.shape[1] != vec.shape[0]:
+                self.misses += 1
+                return None
+            n = self._size
+            sims = self._E[:n] @ vec
+            sims[(now - self._ts[:n]) > self.ttl_sec] = -1.0
+            sims[self._scopes[:n] != scope] = -1.0
+            best = int(np.argmax(sims))
+            if sims[best] >= self.threshold:
+                self.hits += 1
+                self._used[best] = now
+                return self._values[best]
+            self.misses += 1
+            return None
+
+    def put(self, vec: np.ndarray, value: Any, scope: str = "") -> None:
+        now = time.time()
+        with self.lock:
+            if self._E is None or self._E.shape[1] != vec.shape[0]:
+                self._E = np.zeros((self.max_entries, vec.shape[0]), dtype=np.float32)
+                self._size = 0
+            if self._size < self.max_entries:
+                i = self._size
+                self._size += 1
+            else:
+                i = int(np.argmin(self._used))
+            self._E[i] = vec
+            self._ts[i] = now
+            self._used[i] = now
+            self._scopes[i] = scope
+            self._values[i] = value
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "size": self._size}
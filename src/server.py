@@ -1,39 +1,63 @@
 # src/server.py
 import os
 import re
-import json
+import asyncio
 import time
+import base64
+import hashlib
 import sqlite3
-import asyncio
-import tempfile
+import queue
 import logging
 import threading
-from logging.handlers import RotatingFileHandler
-from collections import defaultdict, deque
-from typing import List, Dict, Optional, Tuple
+from collections import OrderedDict
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from typing import Any, List, Dict, Optional, Tuple
+from urllib.parse import quote
 
 from fastapi import FastAPI, Request, UploadFile, File, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse, PlainTextResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse, PlainTextResponse, FileResponse
 from fastapi.templating import Jinja2Templates
+from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+import orjson
 from pydantic import BaseModel
+from starlette.datastructures import Headers
 
-from openai import OpenAI
-
-from .chat import chat_once, build_context_snippets
+from .openai_client import async_client, media_client  # endpoint-urile async (TTS/STT/imagini); chat-ul folosește clientul sync din chat.py
+from .chat import chat_once, chat_once_stream, build_context_snippets, snippet_cache_stats
+from .vector_store import warm_up
+from . import response_cache
 from .moderation import contains_profanity
 from .config import (
-    OPENAI_API_KEY, IMAGE_MODEL, TTS_MODEL, STT_MODEL,
+    IMAGE_MODEL, TTS_MODEL, STT_MODEL,
     ALLOWED_ORIGINS, MAX_PROMPT_CHARS, MAX_TTS_CHARS, MAX_STT_MB,
+    TTS_CACHE_DIR, TTS_CACHE_MAX_MB,
     REQUIRE_CSRF, CSRF_TOKEN
 )
 
-# ---------- OpenAI client ----------
-client = OpenAI(api_key=OPENAI_API_KEY or None)
+# ---------- JSON ----------
+def _dumps(obj) -> bytes:
+    return orjson.dumps(obj)   # C: bytes UTF-8 direct, fără ensure_ascii
+
+class _FastJSONResponse(JSONResponse):
+    """Răspunsurile JSON ale API-ului, serializate cu orjson."""
+    def render(self, content) -> bytes:
+        return _dumps(content)
 
 # ---------- App & templates ----------
-app = FastAPI(title="Smart Librarian")
+app = FastAPI(title="Smart Librarian", default_response_class=_FastJSONResponse)
 templates = Jinja2Templates(directory="src/templates")
+templates.env.auto_reload = False                  # fără os.stat pe template la fiecare request
+INDEX_TMPL = templates.get_template("index.html")  # parsat/compilat o singură dată
+# index.html nu are date per-request -> randat o singură dată, servit ca bytes
+HOME_HTML = INDEX_TMPL.render().encode("utf-8")
+
+# Coperțile generate se scriu pe disc și se servesc static (fără base64 în JSON)
+STATIC_DIR = "static"
+GENERATED_DIR = os.path.join(STATIC_DIR, "generated")
+os.makedirs(GENERATED_DIR, exist_ok=True)
+app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
 # ---------- CORS ----------
 app.add_middleware(
@@ -44,7 +68,48 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ---------- Compresie (JSON / HTML / metrics) ----------
+class _GZipExceptStream:
+    """
+    GZip pentru toate răspunsurile, mai puțin SSE (gzip ar ține delta-urile în buffer până la final)
+    și audio/imagini (deja comprimate). SSE e sărit după cale și după content-type, iar lista nu depinde
+    de excluderile pe care le are (sau nu) versiunea instalată de Starlette.
+    """
+    SKIP_TYPES = ("text/event-stream", "audio/", "image/")
+
+    def __init__(self, app, skip_paths=(), **gzip_kwargs):
+        self.app = app
+        self.gzip_kwargs = gzip_kwargs
+        self.skip_paths = frozenset(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        async def inner(scope, receive, gzip_send):
+            bypass = False
+
+            async def route(message):
+                # content-type se știe abia la http.response.start; un răspuns exclus merge direct la client,
+                # iar responder-ul gzip nu primește niciun mesaj pentru el
+                nonlocal bypass
+                if message["type"] == "http.response.start":
+                    ctype = Headers(raw=message["headers"]).get("content-type", "").lower()
+                    bypass = ctype.startswith(self.SKIP_TYPES)
+                await (send if bypass else gzip_send)(message)
+
+            await self.app(scope, receive, route)
+
+        await GZipMiddleware(inner, **self.gzip_kwargs)(scope, receive, send)
+
+app.add_middleware(_GZipExceptStream, skip_paths=("/api/chat/stream",), minimum_size=512, compresslevel=5)
+
 # ---------- Security headers ----------
+# numele unei coperți e sha256(model + prompt), nu al imaginii: dacă fișierul se regenerează (cache șters,
+# container nou) același URL primește altă imagine -> cache în browser limitat la o zi, fără `immutable`
+_COVER_CACHE = "public, max-age=86400"
+
 @app.middleware("http")
 async def security_headers(request: Request, call_next):
     resp = await call_next(request)
@@ -52,6 +117,8 @@ async def security_headers(request: Request, call_next):
     resp.headers["X-Frame-Options"] = "DENY"
     resp.headers["Referrer-Policy"] = "no-referrer"
     resp.headers["Permissions-Policy"] = "geolocation=(), microphone=*, camera=()"  # microfonul rămâne permis pt STT
+    if request.url.path.startswith("/static/generated/") and resp.status_code == 200:
+        resp.headers["Cache-Control"] = _COVER_CACHE
     return resp
 
 def assert_csrf(request: Request):
@@ -63,48 +130,116 @@ def assert_csrf(request: Request):
         raise HTTPException(status_code=403, detail="CSRF token invalid sau lipsă.")
 
 # ---------- Logs ----------
+class _JsonFormatter(logging.Formatter):
+    """Serializează dict-ul din log_json abia în thread-ul listener-ului, nu pe request."""
+    def format(self, record: logging.LogRecord) -> str:
+        if isinstance(record.msg, dict):
+            return _dumps(record.msg).decode("utf-8")
+        return super().format(record)
+
+class _LazyQueueHandler(QueueHandler):
+    # QueueHandler.prepare() ar formata mesajul pe thread-ul apelantului; îl lăsăm neformatat
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
 os.makedirs("logs", exist_ok=True)
 logger = logging.getLogger("smart_librarian")
 logger.setLevel(logging.INFO)
 handler = RotatingFileHandler("logs/app.log", maxBytes=1_000_000, backupCount=5, encoding="utf-8")
-formatter = logging.Formatter("%(message)s")
+formatter = _JsonFormatter("%(message)s")
 handler.setFormatter(formatter)
-logger.addHandler(handler)
+# request-ul doar pune înregistrarea în coadă; I/O pe disc + JSON se fac în thread-ul QueueListener
+_log_q: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+# loggerul e global în proces: dacă modulul e importat de două ori (ex. `server` și `src.server`,
+# sau reload), scoatem handlerul vechi ca să nu scriem fiecare linie de două ori
+for _h in list(logger.handlers):
+    if getattr(_h, "smart_librarian", False):
+        logger.removeHandler(_h)
+_queue_handler = _LazyQueueHandler(_log_q)
+_queue_handler.smart_librarian = True
+logger.addHandler(_queue_handler)
+logger.propagate = False
+_log_listener = QueueListener(_log_q, handler)
+_log_listener.start()
 
 def log_json(**kwargs):
     try:
-        logger.info(json.dumps(kwargs, ensure_ascii=False))
+        logger.info(kwargs)
     except Exception:
         pass
 
+# ---------- Startup ----------
+@app.on_event("startup")
+def _prewarm():
+    # primul request nu mai plătește deschiderea Chroma (SQLite) și citirea indexului FAISS
+    try:
+        warm_up()
+    except Exception as e:
+        log_json(kind="prewarm_error", error=str(e))
+
+_background_tasks: List["asyncio.Task"] = []
+
+@app.on_event("startup")
+async def _start_bucket_sweeper():
+    _background_tasks.append(asyncio.create_task(_sweep_loop()))
+
+@app.on_event("shutdown")
+async def _close_async_client():
+    await async_client.close()
+
+@app.on_event("shutdown")
+def _flush_on_shutdown():
+    # scrie ce a rămas în coada de mesaje, apoi oprește thread-ul writer
+    if _writer.is_alive():
+        _writer_q.put(None)
+        _writer.join(timeout=5)
+    for task in _background_tasks:
+        task.cancel()
+    _log_listener.stop()   # golește coada de loguri pe disc
+
 # ---------- Metrics (în memorie) ----------
 class Metrics:
     def __init__(self):
         self.lock = threading.Lock()
         self.req_count = 0
-        self.by_path = defaultdict(int)
-        self.latency_sum = defaultdict(float)
-        self.latency_count = defaultdict(int)
+        self.by_path: Dict[str, int] = {}
+        self.latency_sum_ns: Dict[str, int] = {}   # întregi: fără pierdere de precizie la sume mari
+        self.latency_count: Dict[str, int] = {}
         self.chat_tokens_prompt = 0
         self.chat_tokens_completion = 0
+        self.chat_tokens_cached = 0
         self.rate_limit_drops = 0
 
-    def track(self, path: str, dur_sec: float):
+    def track(self, path: str, dur_ns: int):
         with self.lock:
             self.req_count += 1
-            self.by_path[path] += 1
-            self.latency_sum[path] += dur_sec
-            self.latency_count[path] += 1
+            self.by_path[path] = self.by_path.get(path, 0) + 1
+            self.latency_sum_ns[path] = self.latency_sum_ns.get(path, 0) + dur_ns
+            self.latency_count[path] = self.latency_count.get(path, 0) + 1
 
-    def add_tokens(self, prompt: int, completion: int):
+    def add_tokens(self, prompt: int, completion: int, cached: int = 0):
         with self.lock:
             self.chat_tokens_prompt += int(prompt or 0)
             self.chat_tokens_completion += int(completion or 0)
+            self.chat_tokens_cached += int(cached or 0)
 
     def drop(self):
         with self.lock:
             self.rate_limit_drops += 1
 
+    def snapshot(self) -> Dict[str, object]:
+        """Copie consistentă a contorilor; lock-ul e ținut doar cât durează copierea."""
+        with self.lock:
+            return {
+                "by_path": dict(self.by_path),
+                "latency_sum_ns": dict(self.latency_sum_ns),
+                "latency_count": dict(self.latency_count),
+                "tokens_prompt": self.chat_tokens_prompt,
+                "tokens_completion": self.chat_tokens_completion,
+                "tokens_cached": self.chat_tokens_cached,
+                "rate_limit_drops": self.rate_limit_drops,
+            }
+
 metrics = Metrics()
 
 # ---------- Rate limiting (simplu, în memorie) ----------
@@ -116,7 +251,9 @@ LIMITS = {
     "/api/stt": 20,
     "/api/image": 30,
 }
-_buckets: Dict[Tuple[str, str], deque] = {}
+# fereastră fixă: (ip, endpoint) -> (id fereastră, cereri în fereastră); O(1) per decizie
+_buckets: Dict[Tuple[str, str], Tuple[int, int]] = {}
+_bucket_lock = threading.Lock()   # allow() e apelat concurent din threadpool și din event loop
 
 def client_ip(req: Request) -> str:
     xf = req.headers.get("x-forwarded-for")
@@ -128,19 +265,50 @@ def allow(ip: str, key: str) -> bool:
     limit = LIMITS.get(key)
     if not limit:
         return True
-    dq = _buckets.setdefault((ip, key), deque())
-    now = time.time()
-    while dq and now - dq[0] > WINDOW_SEC:
-        dq.popleft()
-    if len(dq) >= limit:
-        return False
-    dq.append(now)
-    return True
+    bk = (ip, key)
+    bid = int(time.time() // WINDOW_SEC)
+    with _bucket_lock:
+        cur = _buckets.get(bk)
+        if cur is None or cur[0] != bid:
+            _buckets[bk] = (bid, 1)
+            return True
+        if cur[1] >= limit:
+            return False
+        _buckets[bk] = (bid, cur[1] + 1)
+        return True
+
+def sweep_buckets() -> int:
+    """Șterge bucket-urile din ferestre expirate (IP-uri inactive); întoarce câte au fost șterse."""
+    bid = int(time.time() // WINDOW_SEC)
+    with _bucket_lock:
+        stale = [bk for bk, (b, _) in _buckets.items() if b != bid]
+        for bk in stale:
+            del _buckets[bk]
+    return len(stale)
+
+async def _sweep_loop():
+    # memoria rămâne proporțională cu clienții activi în fereastra curentă, nu cu toți clienții văzuți vreodată
+    while True:
+        await asyncio.sleep(WINDOW_SEC)
+        sweep_buckets()
 
 # ---------- SQLite (persistență sesiuni) ----------
 DB_PATH = "data/chat_history.db"
 os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-_conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+# cached_statements: SQL-urile fixe de mai jos rămân compilate în cache-ul conexiunii (fără re-parse/re-plan)
+_conn = sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=64)
+# WAL: un singur fsync secvențial per commit, iar cititorii (fetch_history) nu mai așteaptă după scrieri
+for _pragma in (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",      # ~64 MB
+    "PRAGMA mmap_size=268435456",    # 256 MB
+):
+    try:
+        _conn.execute(_pragma)
+    except sqlite3.DatabaseError:
+        pass   # ex. baze :memory: / sisteme de fișiere fără suport pentru WAL
 _conn.execute("""
 CREATE TABLE IF NOT EXISTS messages (
   session_id TEXT,
@@ -149,30 +317,97 @@ CREATE TABLE IF NOT EXISTS messages (
   ts         INTEGER
 )
 """)
+# (session_id, ts): fetch_history citește intervalul unei sesiuni direct din index, parcurs invers,
+# fără scan + sortare; rowid (implicit în index) departajează mesajele din aceeași secundă
+_conn.execute("CREATE INDEX IF NOT EXISTS idx_msg_sid_ts ON messages(session_id, ts)")
 _conn.commit()
 
+_INSERT = "INSERT INTO messages(session_id, role, text, ts) VALUES(?,?,?,?)"
+_SELECT_HISTORY = ("SELECT role, text FROM messages INDEXED BY idx_msg_sid_ts "
+                   "WHERE session_id=? ORDER BY ts DESC, rowid DESC LIMIT ?")
+_DELETE_SESSION = "DELETE FROM messages WHERE session_id=?"
+
+# Scrierile merg printr-o coadă către un singur thread writer (conexiune proprie):
+# request-ul nu mai așteaptă fsync-ul, iar mesajele adunate între timp intră într-o singură tranzacție.
+_WRITE_BATCH_MAX = 256
+_writer_q: "queue.Queue[Optional[Tuple[str, str, str, int]]]" = queue.Queue(maxsize=10_000)
+# rânduri încă nescrise, per sesiune: citirea istoricului așteaptă doar după mesajele sesiunii ei
+_pending: Dict[str, int] = {}
+_pending_cond = threading.Condition()
+
+def _done_pending(rows):
+    with _pending_cond:
+        for sid, *_ in rows:
+            left = _pending.get(sid, 0) - 1
+            if left > 0:
+                _pending[sid] = left
+            else:
+                _pending.pop(sid, None)
+        _pending_cond.notify_all()
+
+def _writer_loop():
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=64)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    stop = False
+    while not stop:
+        batch = [_writer_q.get()]
+        while len(batch) < _WRITE_BATCH_MAX:
+            try:
+                batch.append(_writer_q.get_nowait())
+            except queue.Empty:
+                break
+        rows = [b for b in batch if b is not None]
+        stop = len(rows) != len(batch)   # None = semnal de oprire (shutdown)
+        try:
+            if rows:
+                with conn:   # o tranzacție (un commit) pentru tot lotul
+                    conn.executemany(_INSERT, rows)
+        except Exception as e:
+            log_json(kind="db_write_error", rows=len(rows), error=str(e))
+        finally:
+            _done_pending(rows)
+            for _ in batch:
+                _writer_q.task_done()
+    conn.close()
+
+_writer = threading.Thread(target=_writer_loop, name="chat-history-writer", daemon=True)
+_writer.start()
+
 def save_msg(session_id: str, role: str, text: str):
-    _conn.execute(
-        "INSERT INTO messages(session_id, role, text, ts) VALUES(?,?,?,?)",
-        (session_id, role, text, int(time.time()))
-    )
-    _conn.commit()
+    # apelat și din event loop (chat_endpoint) -> put_nowait, niciodată blocant
+    row = (session_id, role, text, int(time.time()))
+    with _pending_cond:
+        _pending[session_id] = _pending.get(session_id, 0) + 1
+    try:
+        _writer_q.put_nowait(row)
+    except queue.Full:
+        # writer-ul nu ține pasul (DB congestionat): renunțăm la rând în loc să scriem sincron din event loop;
+        # nici istoricul din memorie nu îl primește, ca să rămână identic cu DB-ul
+        _done_pending([row])
+        log_json(kind="db_queue_full", sid=session_id, role=role)
+        return
+    _append_history(session_id, role, text)
+
+def flush_writes(session_id: str):
+    """
+    Așteaptă până când mesajele din coadă ale sesiunii `session_id` sunt scrise în DB.
+    Scrierile altor sesiuni nu întârzie citirea.
+    """
+    with _pending_cond:
+        while _pending.get(session_id) and _writer.is_alive():
+            _pending_cond.wait(timeout=0.5)
 
 def fetch_history(session_id: str, limit: int = 12, max_chars: int = 1800) -> List[Dict[str, str]]:
-    cur = _conn.execute(
-        "SELECT role, text FROM messages WHERE session_id=? ORDER BY ts DESC LIMIT ?",
-        (session_id, limit),
-    )
-    rows = cur.fetchall()
-    rows.reverse()
-    convo = [{"role": r, "text": t} for (r, t) in rows]
+    flush_writes(session_id)   # istoricul include și ultimele mesaje ale sesiunii puse în coadă
+    cur = _conn.execute(_SELECT_HISTORY, (session_id, limit))
+    # rândurile vin de la cel mai nou la cel mai vechi -> tăiem la max_chars din mers, o singură trecere
+    pruned: List[Dict[str, str]] = []
     total = 0
-    pruned = []
-    for m in reversed(convo):
-        total += len(m["text"])
+    for role, text in cur:
+        total += len(text)
         if total > max_chars:
             break
-        pruned.append(m)
+        pruned.append({"role": role, "text": text})
     pruned.reverse()
     return pruned
 
@@ -186,6 +421,59 @@ def history_to_prefix(history: List[Dict[str, str]]) -> str:
     lines.append("")
     return "\n".join(lines)
 
+# Prefixul de istoric se ține în memorie per sesiune și se actualizează incremental: save_msg adaugă
+# rândul nou și reaplică tăierea (limit / max_chars), deci tura următoare nu mai citește din DB.
+# Versiunea sesiunii crește la fiecare mesaj / reset; un prefix citit din DB se păstrează doar dacă
+# între timp n-a apărut niciun mesaj nou (altfel i-ar lipsi rândul respectiv).
+_PREFIX_CACHE_MAX = 1024
+_prefix_lock = threading.Lock()
+_session_version: Dict[str, int] = {}
+# sid -> (limit, max_chars, rânduri în ordine cronologică, prefix)
+_prefix_cache: "OrderedDict[str, Tuple[int, int, List[Dict[str, str]], str]]" = OrderedDict()
+
+def _trim_history(rows: List[Dict[str, str]], limit: int, max_chars: int) -> List[Dict[str, str]]:
+    """Aceeași tăiere ca în fetch_history: ultimele `limit` mesaje, de la cel mai nou, până la max_chars."""
+    kept: List[Dict[str, str]] = []
+    total = 0
+    for m in reversed(rows[-limit:]):
+        total += len(m["text"])
+        if total > max_chars:
+            break
+        kept.append(m)
+    kept.reverse()
+    return kept
+
+def _append_history(session_id: str, role: str, text: str):
+    with _prefix_lock:
+        _session_version[session_id] = _session_version.get(session_id, 0) + 1
+        hit = _prefix_cache.get(session_id)
+        if hit is not None:
+            limit, max_chars, rows, _ = hit
+            rows = _trim_history(rows + [{"role": role, "text": text}], limit, max_chars)
+            _prefix_cache[session_id] = (limit, max_chars, rows, history_to_prefix(rows))
+
+def _bump_session(session_id: str):
+    with _prefix_lock:
+        _session_version[session_id] = _session_version.get(session_id, 0) + 1
+        _prefix_cache.pop(session_id, None)
+
+def history_prefix(session_id: str, limit: int = 12, max_chars: int = 1800) -> str:
+    with _prefix_lock:
+        version = _session_version.get(session_id, 0)
+        hit = _prefix_cache.get(session_id)
+        if hit is not None and hit[0] == limit and hit[1] == max_chars:
+            _prefix_cache.move_to_end(session_id)
+            return hit[3]
+    rows = fetch_history(session_id, limit=limit, max_chars=max_chars)
+    prefix = history_to_prefix(rows)
+    with _prefix_lock:
+        if _session_version.get(session_id, 0) == version:
+            _prefix_cache[session_id] = (limit, max_chars, rows, prefix)
+            _prefix_cache.move_to_end(session_id)
+            while len(_prefix_cache) > _PREFIX_CACHE_MAX:
+                _prefix_cache.popitem(last=False)
+    return prefix
+
 # ---------- Models ----------
 class ChatRequest(BaseModel):
     message: str
@@ -202,57 +490,70 @@ class ResetRequest(BaseModel):
     session_id: str
 
 # ---------- Utils ----------
+_QUOTED_RE = re.compile(r"[\"“„‚'«](.+?)[\"”’'»]")
+_LABEL_RE = re.compile(r"(?:Recomand(?:area)?|Cartea|Titlul)\s*:\s*([^\n\.,;:]+)", re.IGNORECASE)
+
 def _extract_title_from_text(text: str) -> Optional[str]:
     if not text:
         return None
-    m = re.search(r"[\"“„‚'«](.+?)[\"”’'»]", text)
+    m = _QUOTED_RE.search(text)
     if m:
         return m.group(1).strip()
-    m2 = re.search(r"(?:Recomand(?:area)?|Cartea|Titlul)\s*:\s*([^\n\.,;:]+)", text, re.IGNORECASE)
+    if ":" not in text:   # eticheta cere „:”; fără el nu mai rulăm regex-ul IGNORECASE cu alternanțe
+        return None
+    m2 = _LABEL_RE.search(text)
     if m2:
         return m2.group(1).strip()
     return None
 
-def _split_by_words(s: str, max_chars: int = 28):
-    if not s:
-        return
+def _sources_from(snippets: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """Lista de surse pentru UI, din aceleași fragmente care intră în prompt (un singur retrieval per mesaj)."""
+    return [{"title": s["metadata"].get("title", "N/A"),
+             "preview": (s["document"] or "").replace("\n", " ")[:220]}
+            for s in snippets]
+
+def _coalesce_deltas(deltas, min_chars: int = 30):
+    """Grupează fragmentele mici de la model (primul pleacă imediat, restul la ~min_chars)."""
     buf = ""
-    for tok in s.split():
-        if not buf:
-            buf = tok; continue
-        if len(buf) + 1 + len(tok) <= max_chars:
-            buf += " " + tok
-        else:
-            yield buf; buf = tok
+    first = True
+    for d in deltas:
+        buf += d
+        if first or len(buf) >= min_chars or "\n" in d:
+            yield buf
+            buf = ""
+            first = False
     if buf:
         yield buf
 
-async def _yield_stream_chunks(text: str, chunk_chars: int = 28, delay_sec: float = 0.045):
-    for chunk in _split_by_words(text, chunk_chars):
-        yield f'data: {json.dumps({"delta": chunk}, ensure_ascii=False)}\n\n'
-        await asyncio.sleep(delay_sec)
+# ---------- SSE framing ----------
+_SSE_HEADERS = {"Cache-Control": "no-cache", "Connection": "keep-alive", "X-Accel-Buffering": "no"}
+_SSE_DONE = b"data: [DONE]\n\n"
+
+def _sse_delta(text: str) -> bytes:
+    """Cadru SSE `data: {"delta": ...}` ca bytes (escaparea rămâne la encoder-ul JSON)."""
+    return b"data: " + _dumps({"delta": text}) + b"\n\n"
 
 # ---------- Middleware: timing + logs ----------
 @app.middleware("http")
 async def log_and_time(request: Request, call_next):
-    start = time.perf_counter()
+    start = time.perf_counter_ns()
     path = request.url.path
     ip = client_ip(request)
     try:
         response = await call_next(request)
         return response
     finally:
-        dur = time.perf_counter() - start
-        metrics.track(path, dur)
-        log_json(ts=int(time.time()), ip=ip, path=path, method=request.method, latency_ms=int(dur*1000))
+        dur_ns = time.perf_counter_ns() - start
+        metrics.track(path, dur_ns)
+        log_json(ts=int(time.time()), ip=ip, path=path, method=request.method, latency_ms=dur_ns // 1_000_000)
 
 # ---------- Routes ----------
 @app.get("/", response_class=HTMLResponse)
 def home(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    return HTMLResponse(HOME_HTML)
 
 @app.post("/api/chat")
-def chat_endpoint(req: ChatRequest, request: Request):
+async def chat_endpoint(req: ChatRequest, request: Request):
     assert_csrf(request)
     ip = client_ip(request)
     if not allow(ip, "/api/chat"):
@@ -261,7 +562,7 @@ def chat_endpoint(req: ChatRequest, request: Request):
 
     msg = (req.message or "").strip()
     if not msg:
-        return JSONResponse({"error": "Mesajul este gol."}, status_code=400)
+        return _FastJSONResponse({"error": "Mesajul este gol."}, status_code=400)
     if len(msg) > MAX_PROMPT_CHARS:
         raise HTTPException(status_code=413, detail=f"Mesaj prea lung (>{MAX_PROMPT_CHARS} caractere).")
 
@@ -272,37 +573,41 @@ def chat_endpoint(req: ChatRequest, request: Request):
         save_msg(sid, "user", msg); save_msg(sid, "assistant", polite)
         return {"answer": polite, "sources": []}
 
-    snippets = build_context_snippets(msg, k=3)
-    sources: List[Dict[str, str]] = []
-    for s in snippets:
-        title = s["metadata"].get("title", "N/A")
-        preview = (s["document"] or "").replace("\n", " ")[:220]
-        sources.append({"title": title, "preview": preview})
-
-    history = fetch_history(sid, limit=12, max_chars=1800)
-    prefix = history_to_prefix(history)
-    prompt = f"{prefix}Întrebarea curentă: {msg}"
+    # retrieval (embedding + căutare) și istoricul (SQLite) sunt independente -> rulează în paralel
+    snippets, prefix = await asyncio.gather(
+        asyncio.to_thread(build_context_snippets, msg, 3),
+        asyncio.to_thread(history_prefix, sid),
+    )
+    sources = _sources_from(snippets)
 
     save_msg(sid, "user", msg)
-    answer, usage = chat_once(prompt, k=3, return_usage=True)
+    answer, usage = await asyncio.to_thread(chat_once, msg, k=3, return_usage=True, snippets=snippets, history=prefix)
     save_msg(sid, "assistant", answer)
 
-    metrics.add_tokens(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+    metrics.add_tokens(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), usage.get("cached_tokens", 0))
     log_json(kind="chat", ip=ip, sid=sid, prompt_tokens=usage.get("prompt_tokens", 0),
-             completion_tokens=usage.get("completion_tokens", 0))
+             completion_tokens=usage.get("completion_tokens", 0), cached_tokens=usage.get("cached_tokens", 0))
 
     return {"answer": answer, "sources": sources}
 
 @app.get("/api/chat/stream")
 def chat_stream(q: str, sid: Optional[str] = None, request: Request = None):
-    ip = client_ip(request)
+    """Varianta pentru EventSource (frontend-ul): întrebarea vine în query string."""
+    return _chat_stream_response(q, sid, client_ip(request))
+
+@app.post("/api/chat/stream")
+def chat_stream_post(req: ChatRequest, request: Request):
+    """Același stream SSE, cu body JSON ca /api/chat (mesaje lungi, CSRF, întrebarea nu apare în URL/loguri)."""
+    assert_csrf(request)
+    return _chat_stream_response(req.message, req.session_id, client_ip(request))
+
+def _chat_stream_response(q: Optional[str], sid: Optional[str], ip: str) -> StreamingResponse:
     if not allow(ip, "/api/chat/stream"):
         metrics.drop()
         async def too_many():
-            yield f'data: {json.dumps({"delta":"⚠️ Prea multe cereri pe minut. Așteaptă puțin și reîncearcă."}, ensure_ascii=False)}\n\n'
-            yield 'data: [DONE]\n\n'
+            yield _sse_delta("⚠️ Prea multe cereri pe minut. Așteaptă puțin și reîncearcă.") + _SSE_DONE
         return StreamingResponse(too_many(), media_type="text/event-stream",
-                                 headers={"Cache-Control":"no-cache","Connection":"keep-alive","X-Accel-Buffering":"no"})
+                                 headers=_SSE_HEADERS)
 
     q = (q or "").strip()
     if not q:
@@ -316,44 +621,49 @@ def chat_stream(q: str, sid: Optional[str] = None, request: Request = None):
             save_msg(sid, "user", q)
             polite_text = "Prefer să păstrăm conversația politicoasă. Poți reformula te rog? 🙂"
             save_msg(sid, "assistant", polite_text)
-            yield f'data: {json.dumps({"delta": polite_text}, ensure_ascii=False)}\n\n'
-            yield 'data: [DONE]\n\n'
+            yield _sse_delta(polite_text) + _SSE_DONE
         return StreamingResponse(polite(), media_type="text/event-stream",
-                                 headers={"Cache-Control":"no-cache","Connection":"keep-alive","X-Accel-Buffering":"no"})
+                                 headers=_SSE_HEADERS)
 
-    async def event_gen():
+    def event_gen():
+        # generator sincron: StreamingResponse îl rulează în threadpool, deci apelurile blocante nu țin event loop-ul
         # 1) surse
         snippets = build_context_snippets(q, k=3)
-        sources: List[Dict[str, str]] = []
-        for s in snippets:
-            title = s["metadata"].get("title", "N/A")
-            preview = (s["document"] or "").replace("\n", " ")[:220]
-            sources.append({"title": title, "preview": preview})
-        yield 'event: sources\n'
-        yield f'data: {json.dumps({"sources": sources}, ensure_ascii=False)}\n\n'
+        sources = _sources_from(snippets)
+        yield b"event: sources\ndata: " + _dumps({"sources": sources}) + b"\n\n"
 
         # 2) istoric + prompt
-        history = fetch_history(sid, limit=12, max_chars=1800)
-        prefix = history_to_prefix(history)
-        prompt = f"{prefix}Întrebarea curentă: {q}"
+        prefix = history_prefix(sid)
 
         save_msg(sid, "user", q)
 
-        # 3) răspuns + tokens
-        answer, usage = chat_once(prompt, k=3, return_usage=True)
-        metrics.add_tokens(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+        # 3) răspuns token cu token, direct din stream-ul OpenAI
+        usage: Dict[str, int] = {}
+        parts: List[str] = []
+        try:
+            for chunk in _coalesce_deltas(chat_once_stream(q, k=3, usage=usage, snippets=snippets, history=prefix)):
+                parts.append(chunk)
+                yield _sse_delta(chunk)
+        except Exception as e:
+            # headerele (200) au plecat deja -> eroarea ajunge la client ca ultim delta, urmat de [DONE]
+            log_json(kind="chat_stream_error", ip=ip, sid=sid, error=str(e))
+            yield _sse_delta("\n⚠️ Răspunsul a fost întrerupt. Încearcă din nou.") + _SSE_DONE
+            if parts:
+                save_msg(sid, "assistant", "".join(parts).strip())
+            return
+        answer = "".join(parts).strip()
+
+        metrics.add_tokens(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), usage.get("cached_tokens", 0))
         log_json(kind="chat_stream", ip=ip, sid=sid,
                  prompt_tokens=usage.get("prompt_tokens", 0),
-                 completion_tokens=usage.get("completion_tokens", 0))
-
-        async for ev in _yield_stream_chunks(answer, chunk_chars=28, delay_sec=0.045):
-            yield ev
+                 completion_tokens=usage.get("completion_tokens", 0),
+                 cached_tokens=usage.get("cached_tokens", 0))
 
         save_msg(sid, "assistant", answer)
-        yield 'data: [DONE]\n\n'
+        yield _SSE_DONE
 
     return StreamingResponse(event_gen(), media_type="text/event-stream",
-                             headers={"Cache-Control":"no-cache","Connection":"keep-alive","X-Accel-Buffering":"no"})
+                             headers=_SSE_HEADERS)
 
 # ---------- Session maintenance ----------
 @app.post("/api/session/reset")
@@ -362,13 +672,64 @@ def reset_session(req: ResetRequest, request: Request):
     sid = (req.session_id or "").strip()
     if not sid:
         raise HTTPException(status_code=400, detail="session_id lipsă")
-    _conn.execute("DELETE FROM messages WHERE session_id=?", (sid,))
-    _conn.commit()
+    flush_writes(sid)   # altfel un INSERT încă în coadă ar reapărea după ștergere
+    with _conn:   # o singură tranzacție, commit/rollback automat
+        _conn.execute(_DELETE_SESSION, (sid,))
+    _bump_session(sid)
     return {"ok": True}
 
 # ---------- TTS ----------
+# Audio-ul e determinist pentru (model, voce, text) -> cache pe disc adresat prin conținut
+TTS_VOICE = "alloy"
+os.makedirs(TTS_CACHE_DIR, exist_ok=True)
+
+def _tts_cache_key(text: str) -> str:
+    return hashlib.sha256(f"{TTS_MODEL}|{TTS_VOICE}|{text}".encode("utf-8")).hexdigest()
+
+def _tts_cache_path(key: str) -> str:
+    return os.path.join(TTS_CACHE_DIR, f"{key}.mp3")
+
+def _write_atomic(path: str, data: bytes):
+    # fișier temporar + os.replace: nu se servește niciodată un fișier scris pe jumătate
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(data)
+    os.replace(tmp, path)
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as fh:
+        return fh.read()
+
+def _tts_cache_store(path: str, data: bytes):
+    _write_atomic(path, data)
+    _tts_cache_evict()
+
+def _tts_cache_evict():
+    """Peste TTS_CACHE_MAX_MB șterge fișierele cu mtime cel mai vechi, până la ~90% din limită."""
+    max_bytes = TTS_CACHE_MAX_MB * 1024 * 1024
+    entries = []
+    total = 0
+    with os.scandir(TTS_CACHE_DIR) as it:
+        for e in it:
+            if e.is_file() and e.name.endswith(".mp3"):
+                st = e.stat()
+                entries.append((st.st_mtime, st.st_size, e.path))
+                total += st.st_size
+    if total <= max_bytes:
+        return
+    entries.sort()
+    target = int(max_bytes * 0.9)
+    for _, size, p in entries:
+        if total <= target:
+            break
+        try:
+            os.remove(p)
+            total -= size
+        except OSError:
+            pass
+
 @app.post("/api/tts")
-def tts_endpoint(req: TTSRequest, request: Request):
+async def tts_endpoint(req: TTSRequest, request: Request):
     assert_csrf(request)
     ip = client_ip(request)
     if not allow(ip, "/api/tts"):
@@ -381,12 +742,25 @@ def tts_endpoint(req: TTSRequest, request: Request):
     if len(text) > MAX_TTS_CHARS:
         raise HTTPException(status_code=413, detail=f"Text prea lung pentru TTS (>{MAX_TTS_CHARS} caractere).")
 
+    headers = {"Content-Disposition": 'inline; filename="tts.mp3"'}
+    path = _tts_cache_path(_tts_cache_key(text))
+    try:
+        os.utime(path)   # mtime = ultima folosire (pentru evicție)
+        # citit acum, nu de FileResponse la trimitere: evicția (alt thread) poate șterge fișierul oricând
+        cached = await asyncio.to_thread(_read_file, path)
+        return Response(content=cached, media_type="audio/mpeg", headers=headers)
+    except FileNotFoundError:
+        pass   # nu e în cache sau tocmai a fost evictat -> îl generăm din nou
+
     try:
-        result = client.audio.speech.create(model=TTS_MODEL, voice="alloy", input=text)
+        result = await media_client.audio.speech.create(model=TTS_MODEL, voice=TTS_VOICE, input=text)
         audio_bytes = result.content
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Eroare TTS: {e}")
-    headers = {"Content-Disposition": 'inline; filename="tts.mp3"'}
+    try:
+        await asyncio.to_thread(_tts_cache_store, path, audio_bytes)
+    except OSError as e:
+        log_json(kind="tts_cache_error", error=str(e))
     return Response(content=audio_bytes, media_type="audio/mpeg", headers=headers)
 
 # ---------- STT ----------
@@ -406,30 +780,35 @@ async def stt_endpoint(audio: UploadFile = File(...), request: Request = None):
         if ct and ct not in ALLOWED_AUDIO_TYPES:
             raise HTTPException(status_code=415, detail=f"Tip de fișier neacceptat: {ct}")
 
-        raw = await audio.read()
-        if not raw:
+        # UploadFile.file e deja un SpooledTemporaryFile -> îl trimitem direct, fără read() complet + tempfile
+        f = audio.file
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(0)
+        if not size:
             raise HTTPException(status_code=400, detail="Fișier audio gol.")
 
         max_bytes = MAX_STT_MB * 1024 * 1024
-        if len(raw) > max_bytes:
+        if size > max_bytes:
             raise HTTPException(status_code=413, detail=f"Fișier prea mare (> {MAX_STT_MB}MB).")
 
-        suffix = os.path.splitext(audio.filename or "")[1] or ".wav"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(raw); tmp_path = tmp.name
-
-        with open(tmp_path, "rb") as f:
-            tr = client.audio.transcriptions.create(model=STT_MODEL, file=f)
-        os.unlink(tmp_path)
+        filename = os.path.basename(audio.filename or "") or "audio.wav"
+        tr = await media_client.audio.transcriptions.create(model=STT_MODEL, file=(filename, f, ct or "audio/wav"))
         return {"text": getattr(tr, "text", "")}
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Eroare STT: {e}")
+    finally:
+        await audio.close()   # eliberează imediat fișierul temporar (și pe căile de eroare)
 
 # ---------- Image Generation ----------
 @app.post("/api/image")
-def image_endpoint(req: ImageRequest, request: Request):
+async def image_endpoint(req: ImageRequest, request: Request, raw: bool = False):
+    """
+    Generează (sau refolosește de pe disc) coperta și întoarce {"title", "image_url"}.
+    Cu ?raw=1 întoarce direct fișierul PNG (ex. pentru clienți care nu pot face al doilea GET).
+    """
     assert_csrf(request)
     ip = client_ip(request)
     if not allow(ip, "/api/image"):
@@ -446,36 +825,69 @@ def image_endpoint(req: ImageRequest, request: Request):
         f"Generează o ilustrație de copertă sugestivă pentru cartea „{title}”. "
         f"Stil modern, clar, cu contrast bun. Fără text mare pe imagine."
     )
-    try:
-        img = client.images.generate(model=IMAGE_MODEL, prompt=prompt, size="1024x1024", n=1)
-        b64 = img.data[0].b64_json
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Eroare la generarea imaginii: {e}")
-    return {"title": title, "image_b64": b64}
+    # același model + prompt -> același fișier; coperta existentă se refolosește fără apel la API
+    name = hashlib.sha256(f"{IMAGE_MODEL}\n{prompt}".encode("utf-8")).hexdigest() + ".png"
+    path = os.path.join(GENERATED_DIR, name)
+    if not os.path.exists(path):
+        try:
+            # fără retry: fiecare reîncercare ar fi încă o imagine facturată
+            img = await media_client.with_options(max_retries=0).images.generate(model=IMAGE_MODEL, prompt=prompt, size="1024x1024", n=1)
+            data = base64.b64decode(img.data[0].b64_json)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Eroare la generarea imaginii: {e}")
+        await asyncio.to_thread(_write_atomic, path, data)
+    if raw:
+        return FileResponse(path, media_type="image/png",
+                            headers={"X-Book-Title": quote(title), "Cache-Control": "private, max-age=86400"})
+    return {"title": title, "image_url": f"/static/generated/{name}"}
 
 # ---------- /metrics (Prometheus-like) ----------
+# liniile HELP/TYPE sunt fixe -> construite o singură dată
+_H_REQUESTS = ("# HELP smart_requests_total Număr total de request-uri\n"
+               "# TYPE smart_requests_total counter")
+_H_LATENCY = ("# HELP smart_request_latency_seconds Timp total pe endpoint (secunde)\n"
+              "# TYPE smart_request_latency_seconds summary")
+_H_TOKENS = ("# HELP smart_chat_tokens_total Tokeni consumați (prompt/completion)\n"
+             "# TYPE smart_chat_tokens_total counter")
+_H_RESPONSE_CACHE = ("# HELP smart_response_cache_total Lookup-uri în cache-ul semantic de răspunsuri\n"
+                     "# TYPE smart_response_cache_total counter")
+_H_SNIPPET_CACHE = ("# HELP smart_snippet_cache_total Lookup-uri în cache-ul semantic de fragmente (retrieval)\n"
+                    "# TYPE smart_snippet_cache_total counter")
+_H_DROPS = ("# HELP smart_rate_limit_drops_total Cereri respinse de rate limit\n"
+            "# TYPE smart_rate_limit_drops_total counter")
+
 @app.get("/metrics")
 def metrics_endpoint():
-    with metrics.lock:
-        lines = []
-        lines.append("# HELP smart_requests_total Număr total de request-uri")
-        lines.append("# TYPE smart_requests_total counter")
-        for path, cnt in metrics.by_path.items():
-            lines.append(f'smart_requests_total{{path="{path}"}} {cnt}')
-
-        lines.append("# HELP smart_request_latency_seconds Timp total pe endpoint (secunde)")
-        lines.append("# TYPE smart_request_latency_seconds summary")
-        for path, total in metrics.latency_sum.items():
-            count = metrics.latency_count.get(path, 1)
-            lines.append(f'smart_request_latency_seconds_sum{{path="{path}"}} {total:.6f}')
-            lines.append(f'smart_request_latency_seconds_count{{path="{path}"}} {count}')
-
-        lines.append("# HELP smart_chat_tokens_total Tokeni consumați (prompt/completion)")
-        lines.append("# TYPE smart_chat_tokens_total counter")
-        lines.append(f'smart_chat_tokens_total{{type="prompt"}} {metrics.chat_tokens_prompt}')
-        lines.append(f'smart_chat_tokens_total{{type="completion"}} {metrics.chat_tokens_completion}')
-
-        lines.append("# HELP smart_rate_limit_drops_total Cereri respinse de rate limit")
-        lines.append("# TYPE smart_rate_limit_drops_total counter")
-        lines.append(f'smart_rate_limit_drops_total {metrics.rate_limit_drops}')
-        return PlainTextResponse("\n".join(lines))
+    # formatarea se face în afara lock-ului -> track()/add_tokens() nu așteaptă după scrape
+    snap = metrics.snapshot()
+    cache_stats = response_cache.stats()
+    snip_stats = snippet_cache_stats()
+
+    lines = [_H_REQUESTS]
+    for path, cnt in snap["by_path"].items():
+        lines.append(f'smart_requests_total{{path="{path}"}} {cnt}')
+
+    lines.append(_H_LATENCY)
+    latency_count = snap["latency_count"]
+    for path, total_ns in snap["latency_sum_ns"].items():
+        count = latency_count.get(path, 1)
+        lines.append(f'smart_request_latency_seconds_sum{{path="{path}"}} {total_ns / 1e9:.6f}')
+        lines.append(f'smart_request_latency_seconds_count{{path="{path}"}} {count}')
+
+    lines.append(_H_TOKENS)
+    lines.append(f'smart_chat_tokens_total{{type="prompt"}} {snap["tokens_prompt"]}')
+    lines.append(f'smart_chat_tokens_total{{type="completion"}} {snap["tokens_completion"]}')
+    lines.append(f'smart_chat_tokens_total{{type="cached"}} {snap["tokens_cached"]}')
+
+    lines.append(_H_RESPONSE_CACHE)
+    lines.append(f'smart_response_cache_total{{result="exact_hit"}} {cache_stats["exact_hits"]}')
+    lines.append(f'smart_response_cache_total{{result="hit"}} {cache_stats["hits"]}')
+    lines.append(f'smart_response_cache_total{{result="miss"}} {cache_stats["misses"]}')
+
+    lines.append(_H_SNIPPET_CACHE)
+    lines.append(f'smart_snippet_cache_total{{result="hit"}} {snip_stats["hits"]}')
+    lines.append(f'smart_snippet_cache_total{{result="miss"}} {snip_stats["misses"]}')
+
+    lines.append(_H_DROPS)
+    lines.append(f'smart_rate_limit_drops_total {snap["rate_limit_drops"]}')
+    return PlainTextResponse("\n".join(lines))
@@ -1,12 +1,10 @@
-from openai import OpenAI
 from .config import OPENAI_API_KEY, CHAT_MODEL
+from .openai_client import client
 
 def main():
     if not OPENAI_API_KEY:
         raise RuntimeError("Nu ai setat OPENAI_API_KEY în .env")
 
-    client = OpenAI(api_key=OPENAI_API_KEY)
-
     msg = client.chat.completions.create(
         model=CHAT_MODEL,
         messages=[
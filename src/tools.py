@@ -1,18 +1,39 @@
 # src/tools.py
-import json, os
-from typing import Optional, Dict
+import os, threading
+from typing import Optional, Dict, List, Tuple
+
+import orjson
 
 DATA_JSON = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "book_summaries.json")
 
-def _load_data() -> Dict[str, str]:
-    if not os.path.exists(DATA_JSON):
+# (mtime, titlu->rezumat, titlu.casefold()->rezumat, titluri sortate); se reîncarcă doar dacă fișierul s-a schimbat
+_cache: Optional[Tuple[float, Dict[str, str], Dict[str, str], List[str]]] = None
+_lock = threading.Lock()
+
+def _state() -> Tuple[float, Dict[str, str], Dict[str, str], List[str]]:
+    global _cache
+    try:
+        mtime = os.stat(DATA_JSON).st_mtime
+    except FileNotFoundError:
         raise FileNotFoundError(f"Nu găsesc {DATA_JSON}. Asigură-te că ai creat datasetul în Etapa B.")
-    with open(DATA_JSON, "r", encoding="utf-8") as f:
-        return json.load(f)
+    st = _cache
+    if st is not None and st[0] == mtime:
+        return st
+    with _lock:
+        if _cache is None or _cache[0] != mtime:
+            with open(DATA_JSON, "rb") as f:
+                raw = f.read()
+            data: Dict[str, str] = orjson.loads(raw)
+            folded = {k.casefold(): v for k, v in data.items()}
+            _cache = (mtime, data, folded, sorted(data.keys()))
+        return _cache
 
 def get_summary_by_title(title: str) -> Optional[str]:
-    data = _load_data()
-    return data.get(title)
+    _, data, folded, _ = _state()
+    summary = data.get(title)
+    if summary is None and title:
+        summary = folded.get(title.strip().casefold())   # fallback insensibil la majuscule
+    return summary
 
 def list_titles():
-    return sorted(_load_data().keys())
+    return list(_state()[3])
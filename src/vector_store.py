@@ -1,49 +1,167 @@
 # src/vector_store.py
 from __future__ import annotations
+import json
 import os
 import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import lru_cache
 from typing import List, Dict, Any, Optional, Tuple
 
+import numpy as np
 import chromadb
 from chromadb.config import Settings
 
-from .config import CHROMA_DIR, EMBEDDING_MODEL, OPENAI_API_KEY
-from openai import OpenAI
+from .config import (
+    CHROMA_DIR, EMBEDDING_MODEL, EMBEDDING_BACKEND, EMBED_BATCH_MAX, EMBED_BATCH_WAIT_MS,
+    CHROMA_HNSW_M, CHROMA_HNSW_CONSTRUCTION_EF, CHROMA_HNSW_SEARCH_EF,
+)
+from . import ann_index
+from .batcher import EmbedBatcher
+from .openai_client import client as _client
 
-# --- Embeddings (OpenAI) ---
-_client = OpenAI(api_key=OPENAI_API_KEY or None)
+# --- Embeddings (OpenAI sau local) ---
+EMBED_BATCH_SIZE = 256  # input-uri per request la /embeddings (limita API e 2048)
 
-def embed(texts: List[str]) -> List[List[float]]:
-    resp = _client.embeddings.create(model=EMBEDDING_MODEL, input=texts)
-    return [d.embedding for d in resp.data]
+# EMBEDDING_BACKEND=local: all-MiniLM-L6-v2 exportat ONNX (vine cu chromadb, rulează pe onnxruntime).
+# Modelul se descarcă o dată în ~/.cache/chroma și se încarcă la primul apel.
+_local_lock = threading.Lock()
+_local_ef = None
 
-# --- Chroma setup ---
-os.makedirs(CHROMA_DIR, exist_ok=True)
-_chroma = chromadb.PersistentClient(path=CHROMA_DIR, settings=Settings(anonymized_telemetry=False))
+def _local_model():
+    global _local_ef
+    with _local_lock:
+        if _local_ef is None:
+            from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+            _local_ef = ONNXMiniLM_L6_V2(preferred_providers=["CPUExecutionProvider"])
+        return _local_ef
+
+def _embed_local(texts: List[str]) -> List[List[float]]:
+    return [np.asarray(v, dtype=np.float32).tolist() for v in _local_model()(list(texts))]
+
+def embed(texts: List[str], batch_size: int = EMBED_BATCH_SIZE) -> List[List[float]]:
+    if EMBEDDING_BACKEND == "local":
+        return _embed_local(texts)
+    out: List[List[float]] = []
+    for i in range(0, len(texts), batch_size):
+        resp = _client.embeddings.create(model=EMBEDDING_MODEL, input=texts[i:i + batch_size])
+        out.extend(d.embedding for d in resp.data)
+    return out
+
+# întrebările venite concurent (un embedding per request) se grupează într-un singur apel
+_query_batcher = EmbedBatcher(embed, max_batch=EMBED_BATCH_MAX, max_wait_ms=EMBED_BATCH_WAIT_MS)
+
+# LRU pe textul întrebării (spațiile normalizate) + single-flight: aceeași întrebare venită
+# în paralel din mai multe request-uri produce un singur apel la API.
+EMBED_CACHE_MAX = 4096
+_embed_lock = threading.Lock()
+_embed_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+_embed_inflight: Dict[str, Future] = {}
+
+def embed_query(q: str) -> List[float]:
+    key = " ".join((q or "").split())
+    with _embed_lock:
+        vec = _embed_cache.get(key)
+        if vec is not None:
+            _embed_cache.move_to_end(key)
+            return vec
+        fut = _embed_inflight.get(key)
+        owner = fut is None
+        if owner:
+            fut = Future()
+            _embed_inflight[key] = fut
+    if not owner:
+        return fut.result()
+    try:
+        vec = _query_batcher.embed(key)
+    except BaseException as e:
+        with _embed_lock:
+            _embed_inflight.pop(key, None)
+        fut.set_exception(e)
+        raise
+    with _embed_lock:
+        _embed_cache[key] = vec
+        while len(_embed_cache) > EMBED_CACHE_MAX:
+            _embed_cache.popitem(last=False)
+        _embed_inflight.pop(key, None)
+    fut.set_result(vec)
+    return vec
 
+# --- Chroma setup ---
+# Clientul persistent și colecția se deschid o singură dată, la primul apel (sau la startup prin warm_up)
 _COL_NAME = "smart_librarian"
-_collection = _chroma.get_or_create_collection(
-    name=_COL_NAME,
-    metadata={"hnsw:space": "cosine"}
-)
+_COL_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:M": CHROMA_HNSW_M,
+    "hnsw:construction_ef": CHROMA_HNSW_CONSTRUCTION_EF,
+    "hnsw:search_ef": CHROMA_HNSW_SEARCH_EF,
+}
+_col_lock = threading.Lock()
+_chroma = None
+_collection = None
+
+def _get_chroma():
+    global _chroma
+    if _chroma is None:
+        os.makedirs(CHROMA_DIR, exist_ok=True)
+        _chroma = chromadb.PersistentClient(path=CHROMA_DIR, settings=Settings(anonymized_telemetry=False))
+    return _chroma
+
+def get_collection():
+    """Handle-ul unic al colecției; după prima deschidere, calea rapidă e o simplă citire fără lock."""
+    global _collection
+    col = _collection
+    if col is not None:
+        return col
+    with _col_lock:
+        if _collection is None:
+            _collection = _get_chroma().get_or_create_collection(name=_COL_NAME, metadata=_COL_METADATA)
+        return _collection
+
+def warm_up() -> None:
+    """Deschide colecția Chroma, indexul FAISS și (dacă e cazul) modelul local înainte de primul request."""
+    get_collection()
+    ann_index.warm()
+    if EMBEDDING_BACKEND == "local":
+        _local_model()
 
 # --- API public pentru ingestie ---
+_LEGACY_COL_NAMES = ("books",)   # colecții din versiuni mai vechi, nefolosite; ingestul complet le șterge
+
 def reset_collection():
-    try:
-        _chroma.delete_collection(_COL_NAME)
-    except Exception:
-        pass
     global _collection
-    _collection = _chroma.get_or_create_collection(name=_COL_NAME, metadata={"hnsw:space": "cosine"})
+    with _col_lock:
+        for name in (_COL_NAME, *_LEGACY_COL_NAMES):
+            try:
+                _get_chroma().delete_collection(name)
+            except Exception:
+                pass
+        _collection = _get_chroma().get_or_create_collection(name=_COL_NAME, metadata=_COL_METADATA)
+    # indexul FAISS descrie colecția veche; până la rebuild_ann_index căutările merg pe Chroma
+    ann_index.clear()
 
 def add_chunks(chunks: List[str], metadatas: List[Dict[str, Any]], ids: List[str]):
     vecs = embed(chunks)
-    _collection.add(documents=chunks, embeddings=vecs, metadatas=metadatas, ids=ids)
+    get_collection().add(documents=chunks, embeddings=vecs, metadatas=metadatas, ids=ids)
+
+def existing_ids(ids: List[str]) -> set:
+    """ID-urile din `ids` care există deja în colecție (pentru ingest incremental)."""
+    if not ids:
+        return set()
+    return set(get_collection().get(ids=ids, include=[])["ids"])
+
+def rebuild_ann_index() -> bool:
+    """Reconstruiește indexul FAISS (dacă e instalat) din tot conținutul colecției Chroma."""
+    if not ann_index.available():
+        return False
+    data = get_collection().get(include=["embeddings", "documents", "metadatas"])
+    return ann_index.build(data["ids"], data["embeddings"], data["documents"], data["metadatas"])
 
 # --- helper: atașează 'where' doar dacă există filtre reale ---
-def _build_query_kwargs(q: str, n_results: int, where: Optional[Dict[str, Any]]):
+def _build_query_kwargs(q_vec: List[float], n_results: int, where: Optional[Dict[str, Any]]):
     kwargs = dict(
-        query_embeddings=embed([q]),
+        query_embeddings=[q_vec],
         n_results=n_results,
         include=["documents", "metadatas", "distances"],
     )
@@ -54,79 +172,122 @@ def _build_query_kwargs(q: str, n_results: int, where: Optional[Dict[str, Any]])
     return kwargs
 
 # --- căutare brută (semantică) ---
-def query_raw(q: str, n_results: int = 10, where: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-    kwargs = _build_query_kwargs(q, n_results, where)
-    res = _collection.query(**kwargs)
+def query_raw(q: str, n_results: int = 10, where: Optional[Dict[str, Any]] = None,
+              q_vec: Optional[List[float]] = None) -> Dict[str, Any]:
+    if q_vec is None:
+        q_vec = embed_query(q)
+    if not where:
+        # indexul FAISS (dacă există) nu știe de filtre pe metadate -> doar pentru căutări nefiltrate
+        res = ann_index.search(q_vec, n_results)
+        if res is not None:
+            return res
+    kwargs = _build_query_kwargs(q_vec, n_results, where)
+    res = get_collection().query(**kwargs)
     return res
 
+def query_similar(q: str, n_results: int = 5) -> Dict[str, Any]:
+    """Căutare semantică simplă (format Chroma), pe aceeași colecție; folosită de test_retrieval."""
+    return query_raw(q, n_results=n_results)
+
 # --- util: scor lexical simplu (overlap cuvinte) ---
 _word_re = re.compile(r"\w+", re.UNICODE)
 
 def _norm_words(s: str) -> List[str]:
     return [w.lower() for w in _word_re.findall(s or "")]
 
-def _lexical_overlap_score(q: str, text: str) -> float:
-    q_words = set(_norm_words(q))
+@lru_cache(maxsize=4096)
+def _doc_words(text: str) -> frozenset:
+    """Setul de cuvinte al unui fragment; aceleași fragmente revin des în top-N, deci se tokenizează o dată."""
+    return frozenset(_norm_words(text))
+
+def _lexical_overlap_score(q_words: frozenset, text: str) -> float:
+    """Jaccard între cuvintele întrebării (tokenizate o dată de apelant) și cele ale fragmentului."""
     if not q_words:
         return 0.0
-    t_words = _norm_words(text)
+    t_words = _doc_words(text or "")
     if not t_words:
         return 0.0
-    hit = sum(1 for w in t_words if w in q_words)
-    return hit / max(6, len(t_words))
+    inter = len(q_words & t_words)
+    return inter / (len(q_words) + len(t_words) - inter)
 
 # --- reranking pe reguli: semantic + boost pe titlu/teme/autor ---
-def search_with_rerank(q: str, k: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+def _prepared_meta(meta: Dict[str, Any]) -> Tuple[str, str, List[str]]:
+    """
+    (titlu, autor, teme) cu litere mici. Ingestul le scrie deja în metadate (title_low, author_low,
+    themes_low ca listă JSON); pentru fragmente indexate înainte de asta se calculează aici.
+    """
+    title_low = meta.get("title_low")
+    if title_low is None:
+        title_low = (meta.get("title") or "").strip().lower()
+    author_low = meta.get("author_low")
+    if author_low is None:
+        author_low = (meta.get("author") or "").strip().lower()
+    themes_low = meta.get("themes_low")
+    if themes_low is not None:
+        themes = json.loads(themes_low)
+    else:
+        # în ingest, themes este string; îl „expandăm” ușor pentru boost
+        themes = [t.strip().lower() for t in str(meta.get("themes") or "").split(",") if t.strip()]
+    return title_low, author_low, themes
+
+def search_with_rerank(q: str, k: int = 5, filters: Optional[Dict[str, Any]] = None,
+                       q_vec: Optional[List[float]] = None) -> List[Dict[str, Any]]:
     """
     1) ia top-N semantic (N = k*3, min 12)
     2) calculează scor compozit:
        score = 0.60 * semantic + 0.25 * lexical + boosts(titlu/teme/autor)
     3) ordonează și returnează primele k
+    Dacă apelantul are deja embedding-ul întrebării, îl trimite în `q_vec`.
     """
     n = max(12, k * 3)
     where = filters if (filters and len(filters) > 0) else None
-    raw = query_raw(q, n_results=n, where=where)
+    raw = query_raw(q, n_results=n, where=where, q_vec=q_vec)
 
     docs = raw.get("documents", [[]])[0]
     metas = raw.get("metadatas", [[]])[0]
     dists = raw.get("distances", [[]])[0]
 
-    items: List[Tuple[float, Dict[str, Any], str]] = []
+    if not docs:
+        return []
+
+    # tot ce ține doar de întrebare se calculează o singură dată, nu per candidat
     q_low = q.lower()
+    q_low_strip = q_low.strip()
+    q_words = frozenset(_norm_words(q))
+    book_boosts: Dict[Tuple[Any, Any, Any], float] = {}   # fragmentele aceleiași cărți au aceleași metadate
 
-    for doc, meta, dist in zip(docs, metas, dists):
-        sem = 1.0 - float(dist)
-        sem = 0.0 if sem < 0 else (1.0 if sem > 1 else sem)
+    # componentele numerice pe tot lotul de candidați (float64, ca ordinea să rămână cea din Python)
+    sem = np.clip(1.0 - np.asarray(dists, dtype=np.float64), 0.0, 1.0)
+    lex = np.fromiter((_lexical_overlap_score(q_words, d) for d in docs), dtype=np.float64, count=len(docs))
+    boosts = np.zeros(len(docs), dtype=np.float64)
 
-        lex = _lexical_overlap_score(q, doc)
+    for i, meta in enumerate(metas):
+        key = (meta.get("title"), meta.get("author"), meta.get("themes"))
+        boost = book_boosts.get(key)
+        if boost is None:
+            boost = 0.0
+            t_low, author_low, themes_list = _prepared_meta(meta)
 
-        boost = 0.0
-        title = (meta.get("title") or "").strip()
-        author = (meta.get("author") or "").strip()
-        themes_val = meta.get("themes") or ""
-        # în ingest, themes este string; îl „expandăm” ușor pentru boost
-        themes_list = [t.strip().lower() for t in str(themes_val).split(",") if t.strip()]
-
-        if title:
-            t_low = title.lower()
-            if q_low.strip() == t_low:
-                boost += 0.20
-            elif t_low in q_low or q_low in t_low:
-                boost += 0.12
-            else:
-                common = len(set(_norm_words(title)) & set(_norm_words(q)))
-                boost += min(0.10, 0.02 * common)
-
-        for th in themes_list:
-            if th and th in q_low:
-                boost += 0.04
-
-        if author and author.lower() in q_low:
-            boost += 0.06
-
-        score = 0.60 * sem + 0.25 * lex + boost
-        items.append((score, meta, doc))
-
-    items.sort(key=lambda x: x[0], reverse=True)
-    results = [{"document": d, "metadata": m, "score": round(float(s), 4)} for (s, m, d) in items[:k]]
+            if t_low:
+                if q_low_strip == t_low:
+                    boost += 0.20
+                elif t_low in q_low or q_low in t_low:
+                    boost += 0.12
+                else:
+                    common = len(q_words.intersection(_norm_words(t_low)))
+                    boost += min(0.10, 0.02 * common)
+
+            for th in themes_list:
+                if th and th in q_low:
+                    boost += 0.04
+
+            if author_low and author_low in q_low:
+                boost += 0.06
+            book_boosts[key] = boost
+
+        boosts[i] = boost
+
+    scores = 0.60 * sem + 0.25 * lex + boosts
+    order = np.argsort(-scores, kind="stable")[:k]   # stabil: la egalitate păstrează ordinea semantică
+    results = [{"document": docs[i], "metadata": metas[i], "score": round(float(scores[i]), 4)} for i in order]
     return results